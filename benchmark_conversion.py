@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+'''Benchmark of the phenopacket to composition conversion on synthetic data.
+For each kind of phenopacket (interpretation, family interpretation, cohort) a
+synthetic phenopacket of the requested size is generated and every stage of
+the conversion is timed separately:
+    -read: json.load of the phenopacket file
+    -readmessage/validatemessage: protobuf validation from file / from the decoded dict
+    -validate_file: streamed validation from file (bounded memory), cache of
+     the validated subtrees emptied before each repetition
+    -one entry per convert* mapper, applied to the matching part of the phenopacket
+    -convert2report: the whole conversion of the decoded phenopacket, cache of
+     the validated subtrees emptied before each repetition
+    -write_<format>: serialization with each available output format
+    -check_composition: comparison of the composition against itself
+Results are written as json (min/median/mean seconds over the repetitions) so
+that runs of different releases can be compared.
+Example:
+python benchmark_conversion.py --members 200 --variants 50 --repeat 5 --output bench.json
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from routines2compo import Convert2Composition as C, SubtreeCache
+from routines2compo.CheckComposition import check_composition
+from routines2compo.OutputWriters import FORMATS, get_format, write_composition
+from routines2compo.SyntheticPhenopackets import Generator, write_phenopacket
+from interpretation_pb2 import Interpretation
+from phenopackets_pb2 import Cohort
+
+
+def timeit(func,repeat:int)->dict:
+    times=[]
+    error=None
+    for _ in range(repeat):
+        start=time.perf_counter()
+        try:
+            #the converter prints a line per phenopacket
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+        except Exception as e:
+            error=f'{type(e).__name__}: {e}'
+            break
+        times.append(time.perf_counter()-start)
+    if error is not None:
+        return {'error':error}
+    return {'min':min(times),'median':statistics.median(times),'mean':statistics.mean(times),'runs':len(times)}
+
+
+def mapper_stages(jsonp:dict,kind:str,ff:bool=True)->dict:
+    #the convert* mappers applied to the parts of the phenopacket they handle
+    if kind=='cohort':
+        pheno=jsonp['members'][0]
+        stages={'convertMembers':lambda: C.convertMembers(jsonp['members'],ff)}
+    elif kind=='family':
+        family=jsonp['family']
+        pheno=family['proband']
+        stages={'convertFamily':lambda: C.convertFamily(family,ff),
+            'convertPedigree':lambda: C.convertPedigree(family['pedigree'],ff)}
+    else:
+        pheno=jsonp['phenopacket']
+        stages={}
+    stages.update({
+        'convertPheno':lambda: C.convertPheno(pheno,ff),
+        'convertPhenotypicfeatures':lambda: C.convertPhenotypicfeatures(pheno['phenotypicFeatures'],ff),
+        'convertBiosamples':lambda: C.convertBiosamples(pheno['biosamples'],ff),
+        'convertGenes':lambda: C.convertGenes(pheno['genes'],ff),
+        'convertVariants':lambda: C.convertVariants(pheno['variants'],ff),
+        'convertDiseases':lambda: C.convertDiseases(pheno['diseases'],ff),
+        'convertHtsFiles':lambda: C.convertHtsFiles(pheno['htsFiles'],ff),
+        'convertMeta':lambda: C.convertMeta(jsonp['metaData'],ff),
+    })
+    if kind!='cohort':
+        stages['convertDiagnosis']=lambda: C.convertDiagnosis(jsonp['diagnosis'],ff)
+    return stages
+
+
+def bench_kind(kind:str,jsonp:dict,workdir:str,repeat:int)->dict:
+    filename=os.path.join(workdir,kind+'.json')
+    write_phenopacket(filename,jsonp)
+    filectxinfo=filename[:-4]+'ctxinfo'
+    filecontext=filename[:-4]+'context'
+    message=Cohort if kind=='cohort' else Interpretation
+
+    def read():
+        with open(filename,'r') as f:
+            return json.load(f)
+
+    stages={
+        'read':timeit(read,repeat),
+        'readmessage':timeit(lambda: C.readmessage(filename,message()),repeat),
+        'validatemessage':timeit(lambda: C.validatemessage(jsonp,message()),repeat),
+        'validate_file':timeit(lambda: (SubtreeCache.clear(),C.validate_file(filename)),repeat),
+    }
+    for name,func in mapper_stages(jsonp,kind).items():
+        stages[name]=timeit(func,repeat)
+    #emptied so that every repetition validates (and converts) the subtrees again
+    stages['convert2report']=timeit(lambda: (SubtreeCache.clear(),C.convert2report(jsonp,filename,filectxinfo,filecontext,True)),repeat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        composition=C.convert2report(jsonp,filename,filectxinfo,filecontext,True)
+    sizes={}
+    for fmt in FORMATS:
+        try:
+            outfmt=get_format(fmt)
+        except ValueError:
+            continue
+        outputfile=os.path.join(workdir,'COMPOSITION_FROM'+kind+'.json'+outfmt.suffix)
+        stages['write_'+fmt]=timeit(lambda: write_composition(composition,outputfile,fmt),repeat)
+        sizes[fmt]=os.path.getsize(outputfile)
+    targetfile=os.path.join(workdir,'COMPOSITION_FROM'+kind+'.json')
+    stages['check_composition']=timeit(lambda: check_composition(composition,targetfile),repeat)
+    return {'input_bytes':os.path.getsize(filename),'output_bytes':sizes,'stages':stages}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members',help='members of the cohort',type=int,default=50)
+    parser.add_argument('--relatives',help='relatives in the family',type=int,default=5)
+    parser.add_argument('--persons',help='persons in the pedigree',type=int,default=10)
+    parser.add_argument('--features',help='phenotypicFeatures per phenopacket',type=int,default=10)
+    parser.add_argument('--biosamples',help='biosamples per phenopacket',type=int,default=3)
+    parser.add_argument('--variants',help='variants per phenopacket',type=int,default=10)
+    parser.add_argument('--repeat',help='repetitions of each stage',type=int,default=5)
+    parser.add_argument('--seed',help='seed of the synthetic data',type=int,default=0)
+    parser.add_argument('--kinds',help='comma separated kinds among interpretation,family,cohort',default='interpretation,family,cohort')
+    parser.add_argument('--output',help='json file for the results (default stdout)',type=str)
+    args=parser.parse_args()
+
+    gen=Generator(args.seed)
+    sizes={'features':args.features,'biosamples':args.biosamples,'variants':args.variants}
+    phenopackets={
+        'interpretation':lambda: gen.interpretation(**sizes),
+        'family':lambda: gen.interpretation(family=True,relatives=args.relatives,persons=args.persons,**sizes),
+        'cohort':lambda: gen.cohort(args.members,**sizes),
+    }
+    report={
+        'python':sys.version.split()[0],
+        'platform':platform.platform(),
+        'parameters':vars(args),
+        'results':{}
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind in args.kinds.split(','):
+            report['results'][kind]=bench_kind(kind,phenopackets[kind](),workdir,args.repeat)
+
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump(report,f,indent=4)
+    else:
+        print(json.dumps(report,indent=4))
+
+
+if __name__ == '__main__':
+    main()
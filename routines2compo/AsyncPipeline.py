@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+'''asyncio pipeline overlapping the I/O with the conversion.
+    discovery -> read -> convert -> write -> results
+The phenopackets and their sidecars are read by a pool of threads, the
+conversion runs in a pool of processes and the compositions are written by the
+threads again, so that on a slow (network) filesystem the reads and writes of
+some files are hidden behind the conversion of the others.
+Stages are connected by bounded queues: a slow stage stops the ones before it
+instead of piling up files in memory (backpressure).
+The pipeline runs its own event loop in a background thread and run_pipeline
+is a plain generator of the results, in the order of the jobs, shaped as the
+ones of the conversion pool: ((filename,outputfile,files),(composition,error,manifest entry,events))'''
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from routines2compo import Instrumentation
+from routines2compo.CompactComposition import plain
+from routines2compo.Convert2Composition import ConversionError, convert2report
+from routines2compo.Instrumentation import stage, set_file
+from routines2compo.Manifest import manifest_entry
+from routines2compo.OutputWriters import get_format, write_encoded
+from routines2compo.FindPhenopackets import PhenopacketFiles
+from routines2compo.SidecarCache import load_sidecar
+from routines2compo.StreamJson import loads
+
+#files between two stages
+DEPTH=32
+#threads doing the reads and the writes
+IO_THREADS=8
+
+_END=object()
+
+
+def read_job(filename:str,files:PhenopacketFiles)->tuple:
+    '''(raw phenopacket,ctxinfo,context) of filename, its sidecars paired in files'''
+    sidecars=[]
+    for ext in ('ctxinfo','context'):
+        path=getattr(files,ext)
+        if path is None:
+            logging.error(f'A {ext} json file is needed for each phenopacket file[{filename}]')
+            raise ConversionError(filename,f'no .{ext} sidecar')
+        sidecars.append(load_sidecar(path))
+    with stage('read',file=filename) as counters:
+        with open(filename,'rb') as f:
+            raw=f.read()
+        counters['bytes_read']=len(raw)
+    return raw,sidecars[0],sidecars[1]
+
+
+def convert_raw(filename:str,raw:bytes,ctxinfo:dict,context:dict,outputformat:str,keepjson:bool)->tuple:
+    '''runs in the conversion processes: (encoded composition,composition if keepjson,events,error).
+    A failed conversion is returned as its error, with the events recorded until then'''
+    set_file(filename)
+    try:
+        with stage('convert2composition',file=filename):
+            myjson=convert2report(loads(raw),filename,ctxinfo,context,True)
+            with stage('encode',file=filename):
+                encoded=get_format(outputformat).encode(myjson)
+    except Exception as e:
+        return None,None,_drain(),f'{type(e).__name__}: {e}'
+    return encoded,(plain(myjson) if keepjson else None),_drain(),None
+
+def _drain():
+    return Instrumentation.drain() if Instrumentation.enabled else None
+
+
+def write_job(filename:str,outputfile:str,encoded:bytes,outputformat:str)->None:
+    #runs in an io thread: the stage is attributed to filename explicitly
+    with stage('write',file=filename,bytes_written=len(encoded)):
+        write_encoded(encoded,outputfile,outputformat)
+
+
+async def _pipeline(jobs,results:queue.Queue,workers:int,options:dict,manifest:dict,initializer,initargs:tuple)->None:
+    loop=asyncio.get_running_loop()
+    io=ThreadPoolExecutor(max_workers=IO_THREADS)
+    #the conversion pool, started again if a worker dies (see _convert)
+    pool={'cpu':ProcessPoolExecutor(max_workers=workers,initializer=initializer,initargs=initargs)}
+    retrying=asyncio.Lock()
+    toconvert=asyncio.Queue(maxsize=DEPTH)
+    towrite=asyncio.Queue(maxsize=DEPTH)
+    toemit=asyncio.Queue(maxsize=DEPTH)
+
+    async def discover():
+        #the directory walk blocks: it goes on in a thread too
+        jobs_=iter(jobs)
+        while True:
+            job=await loop.run_in_executor(io,next,jobs_,_END)
+            if job is _END:
+                break
+            await toconvert.put((job,loop.run_in_executor(io,read_job,job[0],job[2])))
+        await toconvert.put(_END)
+
+    async def convert():
+        while (item:=await toconvert.get()) is not _END:
+            (filename,outputfile,files),reading=item
+            try:
+                raw,ctxinfo,context=await reading
+            except Exception as e:
+                converting=loop.create_future()
+                converting.set_exception(e)
+            else:
+                converting=asyncio.ensure_future(_convert(filename,raw,ctxinfo,context))
+            await towrite.put(((filename,outputfile,files),converting))
+        await towrite.put(_END)
+
+    def restart(broken:ProcessPoolExecutor)->None:
+        #a dead worker (e.g. killed by the OOM killer) breaks the whole pool
+        if pool['cpu'] is broken:
+            logging.warning('a conversion worker died: the conversion pool is started again')
+            broken.shutdown(wait=False,cancel_futures=True)
+            pool['cpu']=ProcessPoolExecutor(max_workers=workers,initializer=initializer,initargs=initargs)
+
+    async def _convert(filename:str,*args)->tuple:
+        args=(filename,*args,options['outputformat'],options['keepjson'])
+        cpu=pool['cpu']
+        try:
+            return await loop.run_in_executor(cpu,convert_raw,*args)
+        except BrokenProcessPool:
+            restart(cpu)
+        #taken down with the pool: converted again, one retried file at a
+        #time, it only fails if it is the one killing its worker
+        async with retrying:
+            cpu=pool['cpu']
+            try:
+                return await loop.run_in_executor(cpu,convert_raw,*args)
+            except BrokenProcessPool:
+                logging.error(f'a conversion worker died converting {filename}')
+                restart(cpu)
+                raise
+
+    async def write():
+        while (item:=await towrite.get()) is not _END:
+            job,converting=item
+            await toemit.put((job,asyncio.ensure_future(_write(job,converting))))
+        await toemit.put(_END)
+
+    async def _write(job:tuple,converting)->tuple:
+        filename,outputfile,files=job
+        events=None
+        try:
+            encoded,myjson,events,error=await converting
+            if error is not None:
+                return None,error,None,events
+            await loop.run_in_executor(io,write_job,filename,outputfile,encoded,options['outputformat'])
+            entry=None
+            if options['incremental']:
+                previous=manifest['files'].get(filename) if manifest else None
+                entry=await loop.run_in_executor(io,manifest_entry,filename,outputfile,previous,files)
+        except Exception as e:
+            return None,f'{type(e).__name__}: {e}',None,events
+        return myjson,None,entry,events
+
+    async def emit():
+        #in the order of the jobs; the results queue is bounded too
+        while (item:=await toemit.get()) is not _END:
+            job,writing=item
+            await loop.run_in_executor(None,results.put,(job,await writing))
+
+    try:
+        await asyncio.gather(discover(),convert(),write(),emit())
+    finally:
+        io.shutdown(wait=True)
+        pool['cpu'].shutdown(wait=True)
+
+
+def run_pipeline(jobs,workers:int,options:dict,manifest:dict=None,initializer=None,initargs:tuple=()):
+    '''convert the (filename,outputfile,PhenopacketFiles) jobs through the pipeline, yielding
+    ((filename,outputfile,PhenopacketFiles),(composition,error,manifest entry,events)) in the order of the jobs.
+    options as for the conversion pool: outputformat, keepjson, incremental'''
+    results=queue.Queue(maxsize=DEPTH)
+    failure=[]
+
+    def run():
+        try:
+            asyncio.run(_pipeline(jobs,results,workers,options,manifest,initializer,initargs))
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            results.put(_END)
+
+    thread=threading.Thread(target=run,name='conversion-pipeline',daemon=True)
+    thread.start()
+    while (item:=results.get()) is not _END:
+        yield item
+    thread.join()
+    if failure:
+        raise failure[0]
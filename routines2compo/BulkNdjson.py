@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+'''bulk conversion of newline delimited json.
+Each input line is a record:
+    {"phenopacket": {...},
+     "ctxinfo": {...} or "ctxinfoRef": "path of a .ctxinfo file",
+     "context": {...} or "contextRef": "path of a .context file"}
+Relative references are resolved against the directory of the input file and
+the referenced files are loaded once (see SidecarCache).
+Each output line is the composition of the record on the same position (blank
+input lines are not records); a record that cannot be converted gets the line
+    {"error": reason, "record": "<input file>:<line number>"}
+instead, and is logged and written in the dead letter file if one is given
+(as a {"record","output","error","time"} entry: --retry-failed does not apply).
+Only one record (or a window of records with workers>1) is in memory at a time'''
+import json
+import logging
+import os
+
+from routines2compo.Convert2Composition import convert2report
+from routines2compo.SidecarCache import load_sidecar
+from routines2compo.StreamJson import loads
+from routines2compo.OutputWriters import get_format, atomic_path
+from routines2compo.OrderedPool import ordered_map
+from routines2compo import Instrumentation
+
+
+def convert_record(line:str,where:str,basedir:str,ff:bool=True)->json:
+    '''composition for one ndjson record'''
+    record=loads(line)
+    if 'phenopacket' not in record:
+        raise ValueError('record without phenopacket')
+    sidecars={}
+    for ext in ('ctxinfo','context'):
+        if ext in record:
+            sidecars[ext]=record[ext]
+        elif ext+'Ref' in record:
+            sidecars[ext]=load_sidecar(os.path.join(basedir,record[ext+'Ref']))
+        else:
+            raise ValueError(f'record without {ext} or {ext}Ref')
+    return convert2report(record['phenopacket'],where,sidecars['ctxinfo'],sidecars['context'],ff)
+
+
+def _convert_line(line:str,where:str,basedir:str,encode,drain:bool)->tuple:
+    #drain: the events of a worker travel back with its results
+    try:
+        encoded,error=encode(convert_record(line,where,basedir)),None
+    except Exception as e:
+        encoded,error=None,f'{type(e).__name__}: {e}'
+    return encoded,error,Instrumentation.drain() if drain else None
+
+
+def error_line(where:str,error:str)->bytes:
+    '''the placeholder of the record where that could not be converted'''
+    return json.dumps({'error':error,'record':where},sort_keys=True,separators=(',',':')).encode()
+
+
+def convert_ndjson(inputfile:str,outputfile:str,outputformat:str='compact',workers:int=1,deadletter=None,
+        initializer=None,initargs:tuple=())->tuple:
+    '''convert every record of inputfile writing one composition per line in outputfile.
+    deadletter: DeadLetterFile receiving the records that failed.
+    initializer(*initargs): run by each worker process when workers>1.
+    Returns (records converted,records failed)'''
+    outfmt=get_format(outputformat)
+    #one line per composition: indented formats are written compact
+    encode=get_format('compact').encode if outfmt.indent else outfmt.encode
+    basedir=os.path.dirname(os.path.abspath(inputfile))
+    converted=failed=0
+    drain=workers>1 and Instrumentation.enabled
+    with open(inputfile,'r') as f, atomic_path(outputfile) as tmp, outfmt.opener(tmp,outputfile) as out:
+        tasks=((line,f'{inputfile}:{n}',basedir,encode,drain) for n,line in enumerate(f,1) if line.strip())
+        #a record is small: more of them in flight to keep the workers busy
+        for (line,where,_,_,_),(encoded,error,events) in ordered_map(_convert_line,tasks,workers,window=workers*16,
+                initializer=initializer,initargs=initargs,failed=_died):
+            Instrumentation.merge(events)
+            if error is not None:
+                failed+=1
+                print (f'Record {where} not converted: {error}')
+                logging.error(f'record {where} not converted: {error}')
+                if deadletter is not None:
+                    deadletter.add_record(where,outputfile,error)
+                #the following compositions stay on the line of their record
+                out.write(error_line(where,error)+b'\n')
+                continue
+            out.write(encoded+b'\n')
+            converted+=1
+    logging.info(f'{inputfile}: {converted} records converted into {outputfile}, {failed} failed')
+    return converted,failed
+
+
+def _died(args:tuple,e:Exception)->tuple:
+    return None,f'{type(e).__name__}: {e}',None
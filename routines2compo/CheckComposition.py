@@ -1,43 +1,102 @@
 #!/usr/bin/python3
-'''check the obtained json against its target'''
+'''check the obtained json against its target.
+Both jsons are flattened down to their leaves, lists included: every leaf is
+keyed by its path, a tuple of keys and list indexes, so that the two jsons are
+compared with hash lookups. The comparison stops after max_differences
+differences and returns a CheckResult the caller can collect over a batch'''
 import json
-from json_tools import diff
+from collections import namedtuple
+from collections.abc import Mapping
 
-# import copy
-import collections
-
-from typing import Any,Callable
+from typing import Any
 
 import logging
 
-def check_composition(obtainedjson:json,targetfile:str)->None:
+from routines2compo.LazyLog import LazyJson
+
+#differences kept (and comparison stopped) by default
+MAX_DIFFERENCES=20
+
+#matched/mismatched: leaf paths compared equal/different (missing on either side included)
+#differences: the first (path,obtained,target) that differ, MISSING marking an absent leaf
+#complete: False if the comparison stopped at max_differences
+CheckResult=namedtuple('CheckResult',['matched','mismatched','differences','complete'])
+
+MISSING='<missing>'
+
+
+def check_composition(obtainedjson:json,targetfile:str,max_differences:int=MAX_DIFFERENCES)->CheckResult:
     with open(targetfile,'r') as f:
         targetjson = json.load(f)
-#    one=ordered(flatten(obtainedjson))
-#    two=ordered(flatten(targetjson))
-    one=flatten(obtainedjson)
-    two=flatten(targetjson)
-    # print (obtainedjson)
-    # print(one)
-    # print('\n\n')
-    # print (two)
+    result=compare(obtainedjson,targetjson,max_differences)
     logging.info("Phenopacket: diff between obtained and target jsons")
-    logging.info(json.dumps((diff(one,two)),indent=4))
-    return
+    logging.info(f'{result.matched} paths match, {result.mismatched} differ'
+        +('' if result.complete else f' (stopped after {max_differences} differences)'))
+    if result.differences:
+        logging.info('%s',LazyJson([{'path':format_path(path),'obtained':one,'target':two}
+            for path,one,two in result.differences],indent=4))
+    return result
 
 
+def compare(obtained:Any,target:Any,max_differences:int=MAX_DIFFERENCES)->CheckResult:
+    '''leaf by leaf comparison of obtained against target.
+    max_differences=None compares everything'''
+    if obtained==target:
+        #the common case: no need to look at the paths
+        return CheckResult(sum(1 for _ in iterleaves(obtained)),0,[],True)
+    two=flatten(target)
+    matched=0
+    differences=[]
+    seen=0
+    for path,value in iterleaves(obtained):
+        expected=two.get(path,MISSING)
+        if expected is not MISSING:
+            seen+=1
+        if value==expected and type(value)==type(expected):
+            matched+=1
+            continue
+        differences.append((path,value,expected))
+        if max_differences is not None and len(differences)>=max_differences:
+            return CheckResult(matched,len(differences),differences,False)
+    if seen<len(two):
+        #leaves of the target not produced
+        one=set(path for path,_ in iterleaves(obtained))
+        for path,expected in two.items():
+            if path in one:
+                continue
+            differences.append((path,MISSING,expected))
+            if max_differences is not None and len(differences)>=max_differences:
+                return CheckResult(matched,len(differences),differences,False)
+    return CheckResult(matched,len(differences),differences,True)
 
-def flatten(d:dict, parent_key:str='', sep:str='_')->dict:
-    items = []
-    if d is not None:
-        for k, v in d.items():
-            new_key = parent_key + sep + k if parent_key else k
-            if isinstance(v, collections.MutableMapping):
-                items.extend(flatten(v, new_key, sep=sep).items())
-            else:
-                items.append((new_key, v))
-    return dict(items)
 
+def iterleaves(obj:Any,path:tuple=()):
+    '''yield (path,leaf) for every leaf of obj; empty dicts and lists are leaves'''
+    stack=[(path,obj)]
+    while stack:
+        path,obj=stack.pop()
+        if isinstance(obj,Mapping) and obj:
+            stack.extend((path+(k,),v) for k,v in reversed(list(obj.items())))
+        elif isinstance(obj,list) and obj:
+            stack.extend((path+(i,),v) for i,v in reversed(list(enumerate(obj))))
+        else:
+            yield path,obj
+
+
+def flatten(d:Any,parent_key:tuple=())->dict:
+    '''{path:leaf} of d, lists included'''
+    return dict(iterleaves(d,parent_key))
+
+
+def format_path(path:tuple)->str:
+    '''cohort_report/cohort:0/htsfile:0/htsFormat:0|code style path'''
+    out=''
+    for p in path:
+        if isinstance(p,int):
+            out+=f':{p}'
+        else:
+            out+=('/' if out and not p.startswith('|') else '')+p
+    return out
 
 
 def ordered(obj:Any)->Any:
@@ -47,4 +106,3 @@ def ordered(obj:Any)->Any:
         return sorted(ordered(x) for x in obj)
     else:
         return obj
-
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+'''memory-lean representation of a composition.
+In the structured format every element is a dict and almost every value a
+single item list ([{'|id':...}], [{'|value':...}]): a big family or cohort is
+millions of tiny dicts and lists. A Node is a single tuple
+    (shape,value,...)
+    -shape: the sorted keys and, for each of them, how its value is held,
+     interned so that all the elements with the same keys share one shape
+    -the values in the order of the shape
+A value is held as
+    -ONE: the item of a single item list, the list is not stored
+    -MANY: a tuple of the items of a list of any other length
+    -VALUE: a scalar or a dict (itself a Node)
+Nodes are immutable, so that the same term or identifier node can be used in
+any number of places.
+encode/dump serialize a tree of Nodes (and of plain dicts and lists) straight
+to the json of json.dumps(sort_keys=True), byte for byte, without expanding it
+back to dicts; plain() does expand it, for the code that needs the dicts'''
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+
+ONE='1'
+MANY='n'
+VALUE='v'
+
+#pieces of json written at once by dump
+CHUNK=4096
+
+#(keys,kinds)->itself
+_shapes={}
+
+
+class Node(tuple):
+    '''(shape,value,...): a tuple subclass without instance dict, one
+    allocation per element'''
+    __slots__=()
+
+    @property
+    def shape(self)->tuple:
+        return self[0]
+
+    @property
+    def values(self)->tuple:
+        return self[1:]
+
+    def __repr__(self)->str:
+        return f'Node({dict(zip(self[0][0],self.values))!r})'
+
+    def __reduce__(self)->tuple:
+        return _restore,(tuple(self),)
+
+def _restore(items:tuple)->Node:
+    #shapes unpickled in another process are interned there again
+    shape=items[0]
+    return Node((_shapes.setdefault(shape,shape),)+items[1:])
+
+
+def _compact(value):
+    if isinstance(value,dict):
+        return node(value)
+    return value
+
+def node(element:dict)->Node:
+    '''the Node of the dict element, whose values can already be Nodes'''
+    keys=sorted(element)
+    kinds=[]
+    values=[]
+    for key in keys:
+        value=element[key]
+        if isinstance(value,list):
+            if len(value)==1:
+                kinds.append(ONE)
+                values.append(_compact(value[0]))
+            else:
+                kinds.append(MANY)
+                values.append(tuple(_compact(item) for item in value))
+        else:
+            kinds.append(VALUE)
+            values.append(_compact(value))
+    shape=(tuple(keys),''.join(kinds))
+    return Node((_shapes.setdefault(shape,shape),*values))
+
+
+def rows(keys:tuple,columns:list)->list:
+    '''the Nodes of the dicts {key:[value],...} of the rows of columns (one
+    column of values, dicts already Nodes, per key): the shape is made once for
+    the whole table and no dict is built'''
+    order=sorted(range(len(keys)),key=keys.__getitem__)
+    shape=(tuple(keys[k] for k in order),ONE*len(keys))
+    shape=_shapes.setdefault(shape,shape)
+    return [Node((shape,*values)) for values in zip(*(columns[k] for k in order))]
+
+
+def plain(obj):
+    '''obj with its Nodes expanded back to dicts and lists'''
+    if isinstance(obj,Node):
+        element={}
+        keys,kinds=obj[0]
+        for key,kind,value in zip(keys,kinds,islice(obj,1,None)):
+            if kind==ONE:
+                element[key]=[plain(value)]
+            elif kind==MANY:
+                element[key]=[plain(item) for item in value]
+            else:
+                element[key]=plain(value)
+        return element
+    if isinstance(obj,dict):
+        return {key:plain(value) for key,value in obj.items()}
+    if isinstance(obj,list):
+        return [plain(item) for item in obj]
+    return obj
+
+
+def _scalar(value)->str:
+    if isinstance(value,str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value,int):
+        return int.__repr__(value)
+    if isinstance(value,float):
+        if value!=value:
+            return 'NaN'
+        if value in (float('inf'),float('-inf')):
+            return 'Infinity' if value>0 else '-Infinity'
+        return float.__repr__(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class _Encoder:
+    '''writes the json of a tree through write(), formatted as json.dumps with
+    sort_keys=True and indent (None: separators (',',':'))'''
+    def __init__(self,write,indent:int=None):
+        self.write=write
+        self.indent=' '*indent if indent is not None else None
+        self.keysep=': ' if indent is not None else ':'
+
+    def newline(self,level:int)->str:
+        return '\n'+self.indent*level if self.indent is not None else ''
+
+    def encode(self,obj,level:int=0)->None:
+        if isinstance(obj,Node):
+            keys,kinds=obj[0]
+            self.items(zip(keys,kinds,islice(obj,1,None)),bool(keys),level)
+        elif isinstance(obj,dict):
+            self.items(((key,VALUE,obj[key]) for key in sorted(obj)),bool(obj),level)
+        elif isinstance(obj,(list,tuple)):
+            self.array(obj,level)
+        else:
+            self.write(_scalar(obj))
+
+    def items(self,items,nonempty:bool,level:int)->None:
+        if not nonempty:
+            self.write('{}')
+            return
+        write=self.write
+        inner=self.newline(level+1)
+        sep='{'+inner
+        for key,kind,value in items:
+            write(sep+encode_basestring_ascii(key)+self.keysep)
+            sep=','+inner
+            if kind==ONE:
+                #the single item list that is not stored
+                write('['+self.newline(level+2))
+                self.encode(value,level+2)
+                write(inner+']')
+            else:
+                self.encode(value,level+1)
+        write(self.newline(level)+'}')
+
+    def array(self,items,level:int)->None:
+        if not items:
+            self.write('[]')
+            return
+        write=self.write
+        inner=self.newline(level+1)
+        sep='['+inner
+        for item in items:
+            write(sep)
+            sep=','+inner
+            self.encode(item,level+1)
+        write(self.newline(level)+']')
+
+
+def encode(obj,indent:int=None)->str:
+    '''json.dumps(obj,sort_keys=True,indent=indent) of a tree holding Nodes
+    (separators (',',':') without indent)'''
+    chunks=[]
+    _Encoder(chunks.append,indent).encode(obj)
+    return ''.join(chunks)
+
+
+def dump(obj,out,indent:int=None)->None:
+    '''encode obj straight into the binary stream out, a chunk of the json at a time'''
+    chunks=[]
+    def write(chunk:str)->None:
+        chunks.append(chunk)
+        if len(chunks)>=CHUNK:
+            out.write(''.join(chunks).encode())
+            chunks.clear()
+    _Encoder(write,indent).encode(obj)
+    out.write(''.join(chunks).encode())
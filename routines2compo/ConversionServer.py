@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+'''persistent conversion service: started once, it keeps the interpreter, the
+imported modules, the sidecar cache and the term caches warm for all the jobs,
+instead of paying the startup for every file.
+A job is a line, either the path of a phenopacket or a json object
+    {"phenopacket":path,"composition":output file (optional, default placed by
+    the OutputLayout of the server, the directory of the phenopacket as its root)}
+and gets back one json line
+    {"phenopacket","composition","status":"ok"|"error","error","seconds"}
+Jobs are read from stdin (the responses go to stdout, the messages of the
+conversion to stderr) or from the connections to a unix socket, one
+connection at a time, each one sending as many jobs as it likes'''
+import contextlib
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+import time
+
+from routines2compo.OutputLayout import OutputLayout
+
+
+def parse_job(line:str,layout:OutputLayout=None)->tuple:
+    '''(phenopacket,composition) of a job line: the composition defaults to the
+    one of a batch run, ./COMPOSITION_FROM<name of the phenopacket> with the
+    default layout'''
+    line=line.strip()
+    if line.startswith('{'):
+        job=json.loads(line)
+        filename=job['phenopacket']
+        outputfile=job.get('composition')
+    else:
+        filename,outputfile=line,None
+    if not outputfile:
+        outputfile=(layout or OutputLayout()).path(filename)
+    return filename,outputfile
+
+
+def handle(line:str,convert,layout:OutputLayout=None)->dict:
+    '''response of the job line; convert(filename,outputfile)->(composition,error,...)'''
+    start=time.perf_counter()
+    try:
+        filename,outputfile=parse_job(line,layout)
+    except (ValueError,KeyError,TypeError) as e:
+        return {'phenopacket':None,'composition':None,'status':'error',
+            'error':f'bad job {line.strip()[:200]!r}: {type(e).__name__}: {e}','seconds':0.0}
+    error=convert(filename,outputfile)[1]
+    if error is not None:
+        logging.error(f'Conversion of {filename} failed: {error}')
+    return {'phenopacket':filename,'composition':outputfile,'status':'error' if error else 'ok',
+        'error':error,'seconds':time.perf_counter()-start}
+
+
+def serve_stdin(convert,layout:OutputLayout=None,inp=None,out=None)->int:
+    '''serve the jobs of inp (stdin) until its end: the number of jobs served'''
+    inp=inp or sys.stdin
+    out=out or sys.stdout
+    n=0
+    for line in inp:
+        if not line.strip():
+            continue
+        #stdout is the channel of the responses: the prints of the conversion go elsewhere
+        with contextlib.redirect_stdout(sys.stderr):
+            response=handle(line,convert,layout)
+        out.write(json.dumps(response)+'\n')
+        out.flush()
+        n+=1
+    return n
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self)->None:
+        for line in self.rfile:
+            line=line.decode()
+            if not line.strip():
+                continue
+            response=handle(line,self.server.convert,self.server.layout)
+            self.wfile.write((json.dumps(response)+'\n').encode())
+            self.wfile.flush()
+
+
+def _stop(signum,frame):
+    raise KeyboardInterrupt
+
+def serve_socket(path:str,convert,layout:OutputLayout=None)->None:
+    '''serve the jobs sent to the unix socket path until interrupted (SIGINT or SIGTERM)'''
+    signal.signal(signal.SIGTERM,_stop)
+    if os.path.exists(path):
+        #left by a previous server that did not stop cleanly
+        os.remove(path)
+    with socketserver.UnixStreamServer(path,_JobHandler) as server:
+        server.convert=convert
+        server.layout=layout
+        logging.info(f'serving conversion jobs on {path}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(path)
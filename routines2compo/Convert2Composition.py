@@ -2,96 +2,189 @@
 '''convert from a phenopacket (interpretation,cohort,family,phenopacket) to
 an interpretation template composition or a cohort template composition
 To convert from family and phenopacket we create arbitrary fields in an interpretation
-template composition'''
+template composition. A standalone family or phenopacket file becomes an
+interpretation holding only its id, the family/phenopacket and its metadata'''
+import functools
+import importlib
 import json
 import logging
-import sys
-import pathlib
+import os
+import tempfile
+import uuid
+from typing import TYPE_CHECKING
 
-from google.protobuf import message
-from google.protobuf.json_format import Parse, MessageToJson
-from interpretation_pb2 import Interpretation
-from phenopackets_pb2 import Phenopacket,Family,Cohort
+from routines2compo.StreamJson import JsonStreamReader, loads, read_object_streaming
+from routines2compo.OutputWriters import get_format, make_directory, write_composition, write_streamed
+from routines2compo.SidecarCache import load_sidecar
+from routines2compo.FindPhenopackets import PhenopacketFiles, phenopacket_files
+from routines2compo import Instrumentation, SubtreeCache
+from routines2compo.Instrumentation import instrumented, stage, set_file
+from routines2compo.CompactComposition import node, plain, rows
+from routines2compo.MappingEngine import field, compile_record, REQUIRED, VALUE, ID, TERM, TERMS, AGE, CODE, \
+    term, coded, one, many, call, single, nonempty, either, first_pair
 
-def convert2composition(filename:str,outputfile:str)->json:
+if TYPE_CHECKING:
+    from google.protobuf.message import Message as message
+
+
+class ConversionError(Exception):
+    '''a phenopacket that cannot be converted: missing sidecar, not a valid phenopacket...
+    It only concerns filename, the other files of a batch can still be converted'''
+    def __init__(self,filename:str,reason:str):
+        #both in args, so that it can be pickled back from a worker process
+        super().__init__(filename,reason)
+        self.filename=filename
+        self.reason=reason
+
+    def __str__(self)->str:
+        return self.reason
+
+class ValidationError(ValueError):
+    '''a phenopacket not matching the schema: path is the first invalid element
+    (Cohort.members[12], Interpretation.family.relatives[0]...), reason what
+    protobuf found wrong in it'''
+    def __init__(self,path:str,reason:str):
+        super().__init__(path,reason)
+        self.path=path
+        self.reason=reason
+
+    def __str__(self)->str:
+        return f'{self.path}: {self.reason}'
+
+def _unrecognized(filename:str,kind:str,e:Exception)->ConversionError:
+    where=f' at {e.path}' if isinstance(e,ValidationError) else ''
+    print (f'file {filename} unrecognized as {kind}{where}')
+    logging.error(f'file {filename} unrecognized as {kind}{where}: {e}')
+    return ConversionError(filename,f'unrecognized as {kind}: {e}')
+
+def convert2composition(filename:str,outputfile:str,stream:bool=False,outputformat:str='pretty',
+        files:PhenopacketFiles=None)->json:
+    #the stages timed while converting filename are attributed to it
+    set_file(filename)
+    with stage('convert2composition'):
+        return _convert2composition(filename,outputfile,stream,outputformat,files or phenopacket_files(filename))
+
+def _convert2composition(filename:str,outputfile:str,stream:bool,outputformat:str,files:PhenopacketFiles)->json:
     #ff=parameter to toggle insertion of info not coming from the phenopacket
     #useful to make easier the final comparison between the result and the target
     ff=True
-    with open(filename,'r') as f:
-        jsonp = json.load(f)
-        #check needed files existance
-        filectxinfo=filename[:-4]+'ctxinfo'
-        file=pathlib.Path(filectxinfo)
-        if not file.exists():
-            print (f'A .ctxinfo file is needed for each phenopacket file[{filename}]')
-            logging.error(f'A ctxinfo json file is needed for each phenopacket file[{filename}]. It must \
-                        have the same name as the input file but extension .ctxinfo')
-            sys.exit(1)
-        filecontext=filename[:-4]+'context'
-        file=pathlib.Path(filecontext)
-        if not file.exists():
-            print (f'A .context file is needed for each phenopacket file [{filename}]')
-            logging.error(f'A context json file is needed for each phenopacket file[{filename}]. It must \
-                        have the same name as the input file but extension .context')
-            sys.exit(1)
-        #parsing
-        if 'resolutionStatus' in jsonp: #interpretation
-            print(f"{filename} is an Interpretation")
-            logging.info(f"{filename} is an Interpretation")
-            #check if it's a legit phenopacket
-            try:
-                readmessage(filename,Interpretation())
-            except Exception as e:
-                print (f'file {filename} unrecognized as Interpretation phenopacket')
-                logging.error(f'file {filename} unrecognized as Interpretation phenopacket')
-                sys.exit(1)
-            myjson=convert2interpretationreport(jsonp,filectxinfo,filecontext,ff)
-
-        elif 'members' in jsonp: #cohort
-            print(f"{filename} is a Cohort")
-            logging.info("{filename} is a Cohort")
-            #check if it's a legit phenopacket
-            try:
-                readmessage(filename,Cohort())
-            except Exception as e:
-                print (f'file {filename} unrecognized as Cohort phenopacket')
-                logging.error(f'file {filename} unrecognized as Cohort phenopacket')
-                sys.exit(1)
-            myjson=convert2cohortreport(jsonp,filectxinfo,filecontext,ff)
-        with open(outputfile,'w') as g:
-            json.dump(myjson,g,sort_keys=True,indent=4)
-        return myjson
+    #stream=cohort members are read, converted and written one at a time.
+    #The composition is not kept in memory and None is returned
+    #outputformat=one of OutputWriters.FORMATS
+    #files=the sidecars paired with filename when its directory was listed
+    #check needed files existance (own sidecar or the directory shared one)
+    filectxinfo=files.ctxinfo
+    if filectxinfo is None:
+        print (f'A .ctxinfo file is needed for each phenopacket file[{filename}]')
+        logging.error(f'A ctxinfo json file is needed for each phenopacket file[{filename}]. It must \
+                    have the same name as the input file but extension .ctxinfo (or be a shared.ctxinfo in the same dir)')
+        raise ConversionError(filename,'no .ctxinfo sidecar')
+    filecontext=files.context
+    if filecontext is None:
+        print (f'A .context file is needed for each phenopacket file [{filename}]')
+        logging.error(f'A context json file is needed for each phenopacket file[{filename}]. It must \
+                    have the same name as the input file but extension .context (or be a shared.context in the same dir)')
+        raise ConversionError(filename,'no .context sidecar')
+    if stream:
+        #the members of a cohort are converted while the file is read; anything
+        #else (an interpretation) comes back whole and is converted as usual
+        jsonp,nmembers=stream2cohortreport(filename,filectxinfo,filecontext,outputfile,ff,outputformat)
+        if nmembers is not None:
+            return None
+    else:
+        #the file is read and decoded only once: the same dict is validated
+        #against the protobuf schema and then converted (duplicate keys refused
+        #while decoding, as json_format.Parse would)
+        with stage('read') as counters:
+            with open(filename,'r') as f:
+                jsonp = loads(f.read())
+                if Instrumentation.enabled:
+                    counters['bytes_read']=os.fstat(f.fileno()).st_size
+    myjson=convert2report(jsonp,filename,filectxinfo,filecontext,ff)
+    with stage('write') as counters:
+        write_composition(myjson,outputfile,outputformat)
+        if Instrumentation.enabled:
+            counters['bytes_written']=os.path.getsize(outputfile)
+    return myjson
+
+@instrumented()
+def convert2report(jsonp:json,filename:str,filectxinfo:str,filecontext:str,ff:bool)->json:
+    #validate an already decoded phenopacket and convert it to the matching report
+    try:
+        return _convert2report(jsonp,filename,filectxinfo,filecontext,ff)
+    finally:
+        #the digests of the subtrees are only valid for this document
+        SubtreeCache.forget_digests()
+
+def _convert2report(jsonp:json,filename:str,filectxinfo:str,filecontext:str,ff:bool)->json:
+    if 'resolutionStatus' in jsonp: #interpretation
+        print(f"{filename} is an Interpretation")
+        logging.info(f"{filename} is an Interpretation")
+        #check if it's a legit phenopacket
+        try:
+            validate(jsonp,'Interpretation')
+        except Exception as e:
+            raise _unrecognized(filename,'Interpretation phenopacket',e) from e
+        myjson=convert2interpretationreport(jsonp,filectxinfo,filecontext,ff)
+
+    elif 'members' in jsonp: #cohort
+        print(f"{filename} is a Cohort")
+        logging.info(f"{filename} is a Cohort")
+        #check if it's a legit phenopacket
+        try:
+            validate(jsonp,'Cohort')
+        except Exception as e:
+            raise _unrecognized(filename,'Cohort phenopacket',e) from e
+        myjson=convert2cohortreport(jsonp,filectxinfo,filecontext,ff)
+
+    elif 'proband' in jsonp: #family
+        print(f"{filename} is a Family")
+        logging.info(f"{filename} is a Family")
+        try:
+            validate(jsonp,'Family')
+        except Exception as e:
+            raise _unrecognized(filename,'Family phenopacket',e) from e
+        myjson=convert2familyreport(jsonp,filectxinfo,filecontext,ff)
+
+    elif 'id' in jsonp: #phenopacket
+        print(f"{filename} is a Phenopacket")
+        logging.info(f"{filename} is a Phenopacket")
+        try:
+            validate(jsonp,'Phenopacket')
+        except Exception as e:
+            raise _unrecognized(filename,'Phenopacket',e) from e
+        myjson=convert2phenopacketreport(jsonp,filectxinfo,filecontext,ff)
+    else:
+        logging.error(f'file {filename} is not an Interpretation, a Cohort, a Family or a Phenopacket')
+        raise ConversionError(filename,'not an Interpretation, a Cohort, a Family or a Phenopacket')
+    return myjson
 
+@instrumented()
 def convert2interpretationreport(jsonint:json,filectxinfo:str,filecontext:str,ff:bool)->json:
+    return interpretationreport(_mapInterpretation(jsonint,ff),filectxinfo,filecontext)
+
+@instrumented()
+def convert2familyreport(jsonfam:json,filectxinfo:str,filecontext:str,ff:bool)->json:
+    return interpretationreport(_mapFamilyInterpretation(jsonfam,ff),filectxinfo,filecontext)
+
+@instrumented()
+def convert2phenopacketreport(jsonpheno:json,filectxinfo:str,filecontext:str,ff:bool)->json:
+    return interpretationreport(_mapPhenopacketInterpretation(jsonpheno,ff),filectxinfo,filecontext)
+
+def interpretationreport(interpretation:json,filectxinfo:str,filecontext:str)->json:
     myjson={}
     myjson.update(insertctx(filectxinfo))
     interpretation_report={}
     interpretation_report.update(insertcontext(filecontext))
-    interpretation={}
-    #id
-    interpretation['id']=[convertId(jsonint['id'],ff)]
-    #resolution_status
-    resdata={}
-    resdata['|value']=jsonint['resolutionStatus']
-    if ff:
-        resdata['|code']='at0007'
-        resdata['|ordinal']=0
-    interpretation['resolution_status']=[resdata]
-    #phenopacket or family
-    if 'phenopacket' in jsonint:
-        interpretation['phenopacket']=[convertPheno(jsonint['phenopacket'],ff)]
-    elif 'family' in jsonint:
-        interpretation['family']=[convertFamily(jsonint['family'],ff)]
-    #diagnosis
-    interpretation['diagnosis']=convertDiagnosis(jsonint['diagnosis'],ff)
-    #metadata
-    interpretation['metadata']=[convertMeta(jsonint['metaData'],ff)]
-#
     interpretation_report['interpretation']=[interpretation]
     myjson['interpretation_report']=interpretation_report
-    return myjson
+    return _finish(myjson)
 
 def convertId(idf:str,ff:bool)->json:
+    iddata=_cachedid(idf,ff)
+    return iddata.copy() if _terms['copy'] else iddata
+
+def _convertId(idf:str,ff:bool)->json:
     iddata={}
     iddata['|id']=idf
     if ff:
@@ -100,156 +193,272 @@ def convertId(idf:str,ff:bool)->json:
         iddata['|type']='Prescription'
     return iddata
 
+@instrumented()
 def convert2cohortreport(jsoncoh:json,filectxinfo:str,filecontext:str,ff:bool)->json:
     myjson={}
     myjson.update(insertctx(filectxinfo))
     cohort_report={}
     cohort_report.update(insertcontext(filecontext))
-    cohort={}
-    #id
-    cohort['id']=[convertId(jsoncoh['id'],ff)]
-    #description
-    if 'description' in jsoncoh:
-        cohort['description']=[jsoncoh['description']]
-    #members
-    cohort['phenopacket']=convertMembers(jsoncoh['members'],ff)
-    #htsfiles
-    if 'htsFiles' in jsoncoh:
-        cohort['htsfile']=convertHtsFiles(jsoncoh['htsFiles'],ff)
-    #metadata
-    cohort['metadata']=[convertMeta(jsoncoh['metaData'],ff)]
+    cohort=_mapCohort(jsoncoh,ff)
     cohort_report['cohort']=[cohort]
     myjson['cohort_report']=cohort_report
-    return myjson
+    return _finish(myjson)
+
+def stream2cohortreport(filename:str,filectxinfo:str,filecontext:str,outputfile:str,ff:bool,outputformat:str='pretty')->tuple:
+    #same output as convert2cohortreport+write_composition but reading and decoding
+    #the file once: the members are validated, converted and encoded one by one
+    #as they are read, and spooled beside the composition until the rest of the
+    #cohort (the metaData after them...) is known.
+    #Returns (the file without members,number of members or None if it has none)
+    encode=get_format(outputformat).encode
+    #the directory of the composition may not exist yet (--output-dir, --output-layout)
+    with tempfile.TemporaryFile(dir=make_directory(os.path.abspath(outputfile))) as spool:
+        def member(i:int,mem:json)->None:
+            try:
+                validate_once(mem,'Phenopacket',f'Cohort.members[{i}]')
+            except Exception as e:
+                raise _unrecognized(filename,'Cohort phenopacket',e) from e
+            converted=convertPheno(mem,ff)
+            SubtreeCache.forget_digests()
+            encoded=encode(converted)
+            spool.write(len(encoded).to_bytes(8,'little'))
+            spool.write(encoded)
+
+        jsonhead,nmembers=read_object_streaming(filename,'members',member)
+        if nmembers is None:
+            return jsonhead,None
+        print(f"{filename} is a Cohort (streaming)")
+        logging.info(f"{filename} is a Cohort (streaming)")
+        try:
+            validate(jsonhead,'Cohort')
+        except Exception as e:
+            raise _unrecognized(filename,'Cohort phenopacket',e) from e
+        placeholder='@members-'+uuid.uuid4().hex
+        skeleton=plain(convert2cohortreport(dict(jsonhead,members=[]),filectxinfo,filecontext,ff))
+        skeleton['cohort_report']['cohort'][0]['phenopacket']=placeholder
+
+        def members():
+            spool.seek(0)
+            while size:=spool.read(8):
+                yield spool.read(int.from_bytes(size,'little'))
+
+        #no truncated composition is left behind on failure: write_streamed
+        #writes aside and renames only once complete
+        with stage('write_streamed') as counters:
+            n=write_streamed(skeleton,placeholder,members(),outputfile,outputformat)
+            if Instrumentation.enabled:
+                counters['bytes_written']=os.path.getsize(outputfile)
+    Instrumentation.count('members',n,filename)
+    logging.info(f'{n} members streamed from {filename} to {outputfile}')
+    return jsonhead,n
 
+@instrumented('members')
 def convertMembers(jsonmember:list,ff:bool)->list:
-    mems=[]
-    for mem in jsonmember:
-        mems.append(convertPheno(mem,ff))
-    return mems
+    return [convertPheno(mem,ff) for mem in jsonmember]
 
+#filectxinfo/filecontext are the paths of the sidecar files or their already loaded content
 def insertctx(filectxinfo:str)->json:
-    with open(filectxinfo,'r') as f:
-        jsonp = json.load(f)
-    return jsonp
+    if isinstance(filectxinfo,dict):
+        return dict(filectxinfo)
+    return load_sidecar(filectxinfo)
 
 def insertcontext(filecontext:str)->json:
-    with open(filecontext,'r') as f:
-        jsonp = json.load(f)
-    return jsonp
+    if isinstance(filecontext,dict):
+        return dict(filecontext)
+    return load_sidecar(filecontext)
 
 
-def readmessage(string:str,type:message)->message:
+#protobuf and the generated phenopackets modules are most of the import time of
+#the package: they are imported with the first phenopacket validated instead
+#module of the messages not in phenopackets_pb2
+SCHEMA_MODULES={'Interpretation':'interpretation_pb2','MetaData':'base_pb2'}
+
+@functools.lru_cache(maxsize=None)
+def schema(name:str):
+    '''the message class name (Interpretation, Phenopacket, Family, Cohort, MetaData) of the phenopackets v1 schema'''
+    module=importlib.import_module(SCHEMA_MODULES.get(name,'phenopackets_pb2'))
+    return getattr(module,name)
+
+def readmessage(string:str,type:'message')->'message':
+    from google.protobuf.json_format import Parse
     with open(string, 'r') as jsfile:
         round_trip = Parse(message=type, text=jsfile.read())
         return round_trip
 
-def convertPheno(jsonint:json,ff:bool)->json:
-    jp={}
-    #id
-    jp['id']=[convertId(jsonint['id'],ff)]
-    #subject
-    if 'subject' in jsonint:
-        jp['subject']=[jsonint['subject']['id']]
-    #phenotypic_features
-    if 'phenotypicFeatures' in jsonint:
-        jp['phenotypic_feature']=convertPhenotypicfeatures(jsonint['phenotypicFeatures'],ff)
-    #biosamples
-    if 'biosamples' in jsonint:
-        jp['biosample']=convertBiosamples(jsonint['biosamples'],ff)
-    #genes
-    if 'genes' in jsonint:
-        jp['gene']=convertGenes(jsonint['genes'],ff)
-    #variants
-    if 'variants' in jsonint:
-        jp['variant']=convertVariants(jsonint['variants'],ff)
-    #diseases
-    if 'disease' in jsonint:
-        jp['disease']=convertDiseases([jsonint['disease']],ff)
-    if 'diseases' in jsonint:
-       jp['disease']=convertDiseases(jsonint['diseases'],ff)
-    #hts_files
-    if 'htsFiles' in jsonint:
-        jp['htsfile']=convertHtsFiles(jsonint['htsFiles'],ff)
-    #metadata
-    if 'metaData' in jsonint:
-        jp['metadata']=[convertMeta(jsonint['metaData'],ff)]
-        #workaround to buggy phenopacket(member) in cohort that has a void metadata
-        if len(list(jp['metadata'][0].keys()))==0:
-            del jp['metadata']
-    return jp
+@instrumented()
+def validatemessage(jsonp:json,type:'message')->'message':
+    #same check as readmessage but on an already decoded phenopacket
+    from google.protobuf.json_format import ParseDict
+    return ParseDict(jsonp,type)
 
-def convertFamily(jsonint:json,ff:bool)->json:
-    jf={}
-    #id
-    jf['id']=[convertId(jsonint['id'],ff)]
-    #proband
-    jf['proband']=[convertPheno(jsonint['proband'],ff)]
-    #relatives
-    if 'relatives' in jsonint:
-        relatives=[]
-        for rel in jsonint['relatives']:
-            relatives.append(convertPheno(rel,ff))
-        jf['relative']=relatives
-    #pedigree
-    jf['pedigree']=[convertPedigree(jsonint['pedigree'],ff)]
-    #hts_files
-    if 'htsFiles' in jsonint:
-        jf['htsfile']=convertHtsFiles(jsonint['htsFiles'],ff)
-    #metadata
-    jf['metadata']=[convertMeta(jsonint['metaData'],ff)]
-    return jf
+#the subtrees of a message validated on their own, once per distinct content (see SubtreeCache):
+#message->{json field:(message of the field,repeated)}
+SUBTREES={
+    'Interpretation':{'phenopacket':('Phenopacket',False),'family':('Family',False),'metaData':('MetaData',False)},
+    'Family':{'proband':('Phenopacket',False),'relatives':('Phenopacket',True),'metaData':('MetaData',False)},
+    'Cohort':{'members':('Phenopacket',True),'metaData':('MetaData',False)},
+    'Phenopacket':{'metaData':('MetaData',False)},
+}
 
+#json field of a subtree->(message,repeated), whatever the message holding it
+SUBTREE_FIELDS={key:sub for fields in SUBTREES.values() for key,sub in fields.items()}
 
+@functools.lru_cache(maxsize=None)
+def _oneofs(name:str)->dict:
+    '''json field of a subtree of name->the oneof it belongs to'''
+    descriptor=schema(name).DESCRIPTOR
+    return {field.json_name:field.containing_oneof.name for field in descriptor.fields
+        if field.json_name in SUBTREES.get(name,{}) and field.containing_oneof is not None}
 
-def convertMeta(jsonmeta:json,ff:bool)->json:
-    #workaround to buggy phenopacket(member) in cohort that has a void metadata
-    if len(list(jsonmeta.keys()))==0:
-        return {}
-    metadata={}
-    #created
-    metadata['created']=[jsonmeta['created']]
-    #created_by
-    metadata['created_by']=[jsonmeta['createdBy']]
-    #submitted_by
-    if 'submittedBy' in jsonmeta:
-        metadata['submitted_by']=[jsonmeta['submittedBy']]
-    #resources
-    resources=[]
-    for res in jsonmeta['resources']:
-        resource={}
-        resource['id']=[convertId(res['id'],ff)]
-        resource['name']=[res['name']]
-        resource['url']=[res['url']]
-        resource['version']=[res['version']]
-        resource['namespace_prefix']=[res['namespacePrefix']]
-        resource['iri-prefix']=[res['iriPrefix']]
-        resources.append(resource)
-    metadata['resource']=resources
-    if 'externalReferences' in jsonmeta:
-        external_references=[]
-        for ext in jsonmeta['externalReferences']:
-            external_ref={}
-            external_ref['id']=[convertId(ext['id'],ff)]
-            if 'description' in ext:
-                external_ref['description']=[ext['description']]
-            external_references.append(external_ref)
-        metadata['external_reference']=external_references
-    if 'updates' in jsonmeta:
-        updates=[]
-        for upd in jsonmeta['updates']:
-            update={}
-            update['timestamp']=[upd['timestamp']]
-            update['comment']=[upd['comment']]
-            if 'updatedBy' in upd:
-                update['updated_by']=[upd['updatedBy']]
-            updates.append(update)
-        metadata['update']=updates
-    if 'phenopacketSchemaVersion' in jsonmeta:
-        metadata['phenopacket_schema_version']=[jsonmeta['phenopacketSchemaVersion']]
-    return metadata
+def check_oneofs(name:str,keys,path:str)->None:
+    '''the subtrees are taken out of the head of the message: protobuf would not
+    see two of them set in the same oneof (phenopacket and family of an Interpretation)'''
+    oneofs=_oneofs(name)
+    seen=set()
+    for key in keys:
+        oneof=oneofs.get(key)
+        if oneof is None:
+            continue
+        if oneof in seen:
+            raise ValidationError(path,f'Message type "{schema(name).DESCRIPTOR.full_name}" should not have multiple '
+                f'"{oneof}" oneof fields at "{name}".')
+        seen.add(oneof)
+
+def validate(jsonp:json,name:str,path:str=None)->None:
+    '''validatemessage of jsonp as a name message, with its SUBTREES validated apart by validate_once.
+    ValidationError at the path (default name) of the first invalid element'''
+    path=path or name
+    fields={key:sub for key,sub in SUBTREES.get(name,{}).items()
+        if key in jsonp and (not sub[1] or isinstance(jsonp[key],list))}
+    head={key:value for key,value in jsonp.items() if key not in fields} if fields else jsonp
+    check_oneofs(name,fields,path)
+    try:
+        validatemessage(head,schema(name)())
+    except Exception as e:
+        raise ValidationError(path,str(e)) from e
+    for key,(sub,repeated) in fields.items():
+        if repeated:
+            for i,item in enumerate(jsonp[key]):
+                validate_once(item,sub,f'{path}.{key}[{i}]')
+        else:
+            validate_once(jsonp[key],sub,f'{path}.{key}')
+
+def validate_once(jsonp:json,name:str,path:str=None)->None:
+    '''validate jsonp as a name message unless the same content already was'''
+    d=SubtreeCache.remember_digest(jsonp)
+    if not SubtreeCache.is_validated(name,d):
+        validate(jsonp,name,path)
+        SubtreeCache.validated(name,d)
+
+def message_of(keys)->str:
+    '''the message a top level object with keys is converted as, None if none'''
+    if 'resolutionStatus' in keys:
+        return 'Interpretation'
+    if 'members' in keys:
+        return 'Cohort'
+    if 'proband' in keys:
+        return 'Family'
+    if 'id' in keys:
+        return 'Phenopacket'
+    return None
+
+@instrumented()
+def validate_file(filename:str)->str:
+    '''validate filename as it is read, the message name it was validated as.
+    The top level values are decoded one at a time and each subtree (member,
+    relative, phenopacket, family, metaData) is validated as soon as it is
+    complete and then dropped: the memory needed is the one of the biggest
+    subtree, not of the file, nor of its decoded dict and protobuf message.
+    Same outcome as validate of the whole document'''
+    head={}
+    subtrees=[]
+    try:
+        with open(filename,'r') as f:
+            reader=JsonStreamReader(f)
+            for key in reader.items():
+                sub=SUBTREE_FIELDS.get(key)
+                repeated=sub is not None and sub[1]
+                if sub is None or (repeated and reader.peek()!='['):
+                    #not validated on its own, as validate does
+                    head[key]=reader.value()
+                    continue
+                subtrees.append(key)
+                #the message as far as it is known: every message has an id,
+                #the other keys deciding the message can still come
+                name=message_of((set(head)-{'id'})|set(subtrees))
+                if name is None:
+                    owners=[message for message,fields in SUBTREES.items() if key in fields]
+                    name=owners[0] if len(owners)==1 else 'Phenopacket'
+                elif key not in SUBTREES[name]:
+                    #invalid whatever comes next: no message has both keys
+                    raise ValidationError(name,f'Message type "{name}" has no field named "{key}"')
+                check_oneofs(name,subtrees,name)
+                if repeated:
+                    for i,item in enumerate(reader.array()):
+                        validate_once(item,sub[0],f'{name}.{key}[{i}]')
+                        SubtreeCache.forget_digests()
+                else:
+                    validate_once(reader.value(),sub[0],f'{name}.{key}')
+                    SubtreeCache.forget_digests()
+    finally:
+        #they hold the subtrees
+        SubtreeCache.forget_digests()
+    name=message_of(set(head)|set(subtrees))
+    if name is None:
+        raise ValidationError('',"not an Interpretation, a Cohort, a Family or a Phenopacket")
+    for key in subtrees:
+        if key not in SUBTREES[name]:
+            raise ValidationError(name,f'Message type "{name}" has no field named "{key}"')
+    check_oneofs(name,subtrees,name)
+    try:
+        validatemessage(head,schema(name)())
+    except Exception as e:
+        raise ValidationError(name,str(e)) from e
+    return name
+
+def deduplicated(mapper):
+    '''mapper(src,ff) converted once per distinct content of src, when the converted
+    subtrees are shared and the digest of src is known (see SubtreeCache)'''
+    name=mapper.__name__
+    @functools.wraps(mapper)
+    def wrapper(src:json,ff:bool)->json:
+        d=None if _terms['copy'] else SubtreeCache.digest_of(src)
+        if d is None:
+            return mapper(src,ff)
+        key=(name,ff,d)
+        converted=SubtreeCache.converted(key)
+        if converted is None:
+            converted=mapper(src,ff)
+            SubtreeCache.remember_converted(key,converted)
+        return converted
+    return wrapper
+
+#the same ontology terms and identifiers occur over and over in a cohort: their
+#conversion is cached (bounded, least recently used evicted). Each occurrence gets
+#its own copy of the cached dict unless the shared mode is on: then all the
+#occurrences are the very same dict, which saves the allocations but requires
+#the compositions not to be modified after the conversion. Compact nodes are
+#immutable: they are always shared
+TERM_CACHE_SIZE=4096
+_terms={'shared':False,'size':TERM_CACHE_SIZE,'copy':True}
+
+def configure_terms(shared:bool=False,size:int=TERM_CACHE_SIZE)->None:
+    global _cachedidcode,_cachedid
+    _terms.update(shared=shared,size=size,copy=not shared and not _nodes['compact'])
+    #converted with the previous settings
+    SubtreeCache.clear_converted()
+    if _nodes['compact']:
+        _cachedidcode=functools.lru_cache(maxsize=size)(lambda idt,label: node(_convertIdcode(idt,label)))
+        _cachedid=functools.lru_cache(maxsize=size)(lambda idf,ff: node(_convertId(idf,ff)))
+    else:
+        _cachedidcode=functools.lru_cache(maxsize=size)(_convertIdcode)
+        _cachedid=functools.lru_cache(maxsize=size)(_convertId)
 
 def convertIdcode(idt:str,label:str)->json:
+    ptype=_cachedidcode(idt,label)
+    return ptype.copy() if _terms['copy'] else ptype
+
+def _convertIdcode(idt:str,label:str)->json:
     values=idt.split(':')
     ptype={}
     ptype['|code']=values[1]
@@ -258,228 +467,320 @@ def convertIdcode(idt:str,label:str)->json:
     return ptype
 
 
-def convertPhenotypicfeatures(jsonphenot:list,ff)->list:
-    phenotypic_features=[]
-    for phen in jsonphenot:
-        phenotypic_feature={}
-        phenotypic_feature['type']=[convertIdcode(phen['type']['id'],phen['type']['label'])]
-        if 'description' in phen:
-            phenotypic_feature['description']=[phen['description']]
-        if 'negated' in phen:
-            phenotypic_feature['negated']=[phen['negated']]
-        else:
-            phenotypic_feature['negated']=[False]
-        if 'severity' in phen:
-            phenotypic_feature['severity']=[convertIdcode(phen['severity']['id'],phen['severity']['label'])]
-        if 'modifiers' in phen:
-            modifiers=[]
-            for modi in phen['modifiers']:
-                modifier=convertIdcode(modi['id'],modi['label'])
-                modifiers.append(modifier)
-            phenotypic_feature['modifier']=modifiers
-        if 'classOfOnset' in phen:
-            phenotypic_feature['onset']=[convertIdcode(phen['classOfOnset']['id'],phen['classOfOnset']['label'])]
-        if 'evidence' in phen:
-            evidences=[]
-            for evid in phen['evidence']:
-                evidence={}
-                evidence['evidence_code']=[convertIdcode(evid['evidenceCode']['id'],evid['evidenceCode']['label'])]
-                if 'reference' in evid:
-                    ref={}
-                    ref['id']=[convertId(evid['reference']['id'],ff)]
-                    if 'description' in evid['reference']:
-                        ref['description']=[evid['reference']['description']]
-                    evidence['external_reference']=[ref]
-                evidences.append(evidence)
-            phenotypic_feature['evidence']=evidences
-        phenotypic_features.append(phenotypic_feature)
-    return phenotypic_features
+#Mapping tables: phenopacket v1 record -> composition node, see MappingEngine.
+#They are compiled by configure_nodes into the _map* functions; the convert*
+#mappers are thin wrappers over them
+INTERPRETATION=[
+    field('id','id',ID,REQUIRED),
+    field('resolutionStatus','resolution_status',coded('at0007',valuefirst=True),REQUIRED),
+    #phenopacket or else family
+    field('',None,either(('phenopacket','convertPheno'),('family','convertFamily'))),
+    field('diagnosis','diagnosis',call('convertDiagnosis'),REQUIRED),
+    field('metaData','metadata',one('convertMeta'),REQUIRED),
+]
+#a standalone family or phenopacket
+FAMILY_INTERPRETATION=[
+    field('id','id',ID,REQUIRED),
+    field('','family',one('convertFamily')),
+    field('metaData','metadata',one('convertMeta'),REQUIRED),
+]
+PHENOPACKET_INTERPRETATION=[
+    field('id','id',ID,REQUIRED),
+    field('','phenopacket',one('convertPheno')),
+    field('metaData','metadata',nonempty('convertMeta')),
+]
+COHORT=[
+    field('id','id',ID,REQUIRED),
+    field('description','description',VALUE),
+    field('members','phenopacket',call('convertMembers'),REQUIRED),
+    field('htsFiles','htsfile',call('convertHtsFiles')),
+    field('metaData','metadata',one('convertMeta'),REQUIRED),
+]
+PHENOPACKET=[
+    field('id','id',ID,REQUIRED),
+    field('subject.id','subject',VALUE),
+    field('phenotypicFeatures','phenotypic_feature',call('convertPhenotypicfeatures')),
+    field('biosamples','biosample',call('convertBiosamples')),
+    field('genes','gene',call('convertGenes')),
+    field('variants','variant',call('convertVariants')),
+    field('disease','disease',single('convertDiseases')),
+    #diseases wins over disease
+    field('diseases','disease',call('convertDiseases')),
+    field('htsFiles','htsfile',call('convertHtsFiles')),
+    #workaround to buggy phenopacket(member) in cohort that has a void metadata
+    field('metaData','metadata',nonempty('convertMeta')),
+]
+FAMILY=[
+    field('id','id',ID,REQUIRED),
+    field('proband','proband',one('convertPheno'),REQUIRED),
+    field('relatives','relative',many('convertPheno')),
+    field('pedigree','pedigree',one('convertPedigree'),REQUIRED),
+    field('htsFiles','htsfile',call('convertHtsFiles')),
+    field('metaData','metadata',one('convertMeta'),REQUIRED),
+]
+EXTERNAL_REFERENCE=[
+    field('id','id',ID,REQUIRED),
+    field('description','description',VALUE),
+]
+RESOURCE=[
+    field('id','id',ID,REQUIRED),
+    field('name','name',VALUE,REQUIRED),
+    field('url','url',VALUE,REQUIRED),
+    field('version','version',VALUE,REQUIRED),
+    field('namespacePrefix','namespace_prefix',VALUE,REQUIRED),
+    field('iriPrefix','iri-prefix',VALUE,REQUIRED),
+]
+UPDATE=[
+    field('timestamp','timestamp',VALUE,REQUIRED),
+    field('comment','comment',VALUE,REQUIRED),
+    field('updatedBy','updated_by',VALUE),
+]
+METADATA=[
+    field('created','created',VALUE,REQUIRED),
+    field('createdBy','created_by',VALUE,REQUIRED),
+    field('submittedBy','submitted_by',VALUE),
+    field('resources','resource',many('_mapResource'),REQUIRED),
+    field('externalReferences','external_reference',many('_mapExternalReference')),
+    field('updates','update',many('_mapUpdate')),
+    field('phenopacketSchemaVersion','phenopacket_schema_version',VALUE),
+]
+EVIDENCE=[
+    field('evidenceCode','evidence_code',TERM,REQUIRED),
+    field('reference','external_reference',one('_mapExternalReference')),
+]
+PHENOTYPIC_FEATURE=[
+    field('type','type',TERM,REQUIRED),
+    field('description','description',VALUE),
+    field('negated','negated',VALUE,[False]),
+    field('severity','severity',TERM),
+    field('modifiers','modifier',TERMS),
+    field('classOfOnset','onset',TERM),
+    field('evidence','evidence',many('_mapEvidence')),
+]
+PROCEDURE=[
+    field('code','code',TERM,REQUIRED),
+    field('bodySite','body_site',TERM),
+]
+BIOSAMPLE=[
+    field('id','id',ID,REQUIRED),
+    field('individualId','individual_id',ID),
+    field('description','description',VALUE),
+    field('sampledTissue','sampled_tissue',TERM,REQUIRED),
+    field('phenotypicFeatures','phenotypiFeatures',call('convertPhenotypicfeatures')),
+    field('taxonomy','taxonomy',TERM),
+    field('ageOfIndividualAtCollection','individual_age_at_collection',AGE),
+    field('histologicalDiagnosis','histological_diagnosis',TERM),
+    field('tumorProgression','tumor_progression',TERM),
+    field('tumorGrade','tumor_grade',TERM),
+    field('diagnosticMarkers','diagnostic_markers',TERMS),
+    field('procedure','procedure',one('_mapProcedure')),
+    field('htsFiles','htsfile',call('convertHtsFiles')),
+    field('variants','variants',call('convertVariants')),
+    field('isControlSample','is_control_sample',VALUE,[False]),
+]
+HTSFILE=[
+    field('uri','uri',VALUE,REQUIRED),
+    field('htsFormat','htsFormat',CODE,REQUIRED),
+    field('genomeAssembly','genome_assembly',VALUE,REQUIRED),
+    field('description','description',VALUE),
+    #only the first individual->sample pair
+    field('individualToSampleIdentifiers',None,first_pair('individual_identifier','sample_identifier')),
+]
+HGVS_ALLELE=[
+    field('id','id',ID),
+    field('hgvs','hgvs',VALUE,REQUIRED),
+]
+VCF_ALLELE=[
+    field('id','id',ID),
+    field('genomeAssembly','genome_assembly',VALUE,REQUIRED),
+    field('chr','chr',VALUE,REQUIRED),
+    field('pos','pos',VALUE,REQUIRED),
+    field('ref','re',VALUE,REQUIRED),
+    field('alt','alt',VALUE,REQUIRED),
+    field('info','info',VALUE,REQUIRED),
+]
+SPDI_ALLELE=[
+    field('id','id',ID),
+    field('seqId','seq_id',ID,REQUIRED),
+    field('position','position',VALUE,REQUIRED),
+    field('deletedSequence','deleted_sequence',VALUE,REQUIRED),
+    field('insertedSequence','inserted_sequence',VALUE,REQUIRED),
+]
+ISCN_ALLELE=[
+    field('id','id',ID),
+    field('iscn','iscn',VALUE,REQUIRED),
+]
+#all the variants of a list are folded in one node, the last one wins: each
+#allele (and the zygosity) of the node is the one of the last variant holding it
+VARIANT=[
+    field('zygosity','zygosity',TERM),
+    field('hgvsAllele','hgvsallele',one('_mapHgvsAllele')),
+    field('vcfAllele','vcfallele',one('_mapVcfAllele')),
+    field('spdiAllele','spdiallele',one('_mapSpdiAllele')),
+    field('iscnAllele','iscnallele',one('_mapIscnAllele')),
+]
+GENE=[
+    field('',"gene_symbol",term('symbol')),
+]
+DISEASE=[
+    field('term','term',TERM,REQUIRED),
+    field('ageOfOnset','onset',AGE),
+    field('tumorStage','tumor_stage',TERMS),
+]
+DIAGNOSIS=[
+    field('disease','disease',single('convertDiseases'),REQUIRED),
+    field('genomicInterpretations','genomic_interpretation',one('convertGenomicInterpretations'),REQUIRED),
+]
+#the persons are mapped a column at a time, see convertPersons
+PEDIGREE=[
+    field('persons','person',call('convertPersons'),REQUIRED),
+]
 
+#compact: the compositions are built as CompactComposition Nodes instead of
+#dicts and lists, a fraction of their memory on big families and cohorts.
+#The serializers of OutputWriters write both the same way
+_nodes={'compact':False}
+
+def _asis(element:dict)->dict:
+    return element
+
+def configure_nodes(compact:bool=False)->None:
+    global _finish,_mapInterpretation,_mapFamilyInterpretation,_mapPhenopacketInterpretation,_mapCohort,\
+        _mapPheno,_mapFamily,_mapExternalReference,_mapResource,_mapUpdate,_mapMeta,_mapEvidence,\
+        _mapPhenotypicfeature,_mapProcedure,_mapBiosample,_mapHtsFile,_mapHgvsAllele,_mapVcfAllele,\
+        _mapSpdiAllele,_mapIscnAllele,_mapVariant,_mapGene,_mapDisease,_mapDiagnosis,_mapPedigree
+    _nodes['compact']=compact
+    _finish=node if compact else _asis
+    def compiled(name:str,fields:list):
+        return compile_record(name,fields,globals(),node if compact else None)
+    _mapInterpretation=compiled('_mapInterpretation',INTERPRETATION)
+    _mapFamilyInterpretation=compiled('_mapFamilyInterpretation',FAMILY_INTERPRETATION)
+    _mapPhenopacketInterpretation=compiled('_mapPhenopacketInterpretation',PHENOPACKET_INTERPRETATION)
+    _mapCohort=compiled('_mapCohort',COHORT)
+    _mapPheno=compiled('_mapPheno',PHENOPACKET)
+    _mapFamily=compiled('_mapFamily',FAMILY)
+    _mapExternalReference=compiled('_mapExternalReference',EXTERNAL_REFERENCE)
+    _mapResource=compiled('_mapResource',RESOURCE)
+    _mapUpdate=compiled('_mapUpdate',UPDATE)
+    _mapMeta=compiled('_mapMeta',METADATA)
+    _mapEvidence=compiled('_mapEvidence',EVIDENCE)
+    _mapPhenotypicfeature=compiled('_mapPhenotypicfeature',PHENOTYPIC_FEATURE)
+    _mapProcedure=compiled('_mapProcedure',PROCEDURE)
+    _mapBiosample=compiled('_mapBiosample',BIOSAMPLE)
+    _mapHtsFile=compiled('_mapHtsFile',HTSFILE)
+    _mapHgvsAllele=compiled('_mapHgvsAllele',HGVS_ALLELE)
+    _mapVcfAllele=compiled('_mapVcfAllele',VCF_ALLELE)
+    _mapSpdiAllele=compiled('_mapSpdiAllele',SPDI_ALLELE)
+    _mapIscnAllele=compiled('_mapIscnAllele',ISCN_ALLELE)
+    _mapVariant=compiled('_mapVariant',VARIANT)
+    _mapGene=compiled('_mapGene',GENE)
+    _mapDisease=compiled('_mapDisease',DISEASE)
+    _mapDiagnosis=compiled('_mapDiagnosis',DIAGNOSIS)
+    _mapPedigree=compiled('_mapPedigree',PEDIGREE)
+    configure_terms(_terms['shared'],_terms['size'])
 
-def convertBiosamples(jsonbio:list,ff:bool)->list:
-    biosamples=[]
-    for bio in jsonbio:
-        biosample={}
-        biosample['id']=[convertId(bio['id'],ff)]
-        if 'individualId' in bio:
-            biosample['individual_id']=[convertId(bio['individualId'],ff)]
-        if 'description' in bio:
-            biosample['description']=[bio['description']]
-        biosample['sampled_tissue']=[convertIdcode(bio['sampledTissue']['id'],bio['sampledTissue']['label'])]
-        if 'phenotypicFeatures' in bio:
-            biosample['phenotypiFeatures']=convertPhenotypicfeatures(bio['phenotypicFeatures'])
-        if 'taxonomy' in bio:
-            biosample['taxonomy']=[convertIdcode(bio['taxonomy']['id'],bio['taxonomy']['label'])]
-        if 'ageOfIndividualAtCollection' in bio:
-            biosample['individual_age_at_collection']=[{'duration_value':[bio['ageOfIndividualAtCollection']['age']]}]
-        if 'histologicalDiagnosis' in bio:
-            biosample['histological_diagnosis']=[convertIdcode(bio['histologicalDiagnosis']['id'],bio['histologicalDiagnosis']['label'])]
-        if 'tumorProgression' in bio:
-            biosample['tumor_progression']=[convertIdcode(bio['tumorProgression']['id'],bio['tumorProgression']['label'])]
-        if 'tumorGrade' in bio:
-            biosample['tumor_grade']=[convertIdcode(bio['tumorGrade']['id'],bio['tumorGrade']['label'])]
-        if 'diagnosticMarkers' in bio:
-            diamarks=[]
-            for dm in bio['diagnosticMarkers']:
-                diamarks.append(convertIdcode(dm['id'],dm['label']))
-            biosample['diagnostic_markers']=diamarks
-        if 'procedure' in bio:
-            procedure={}
-            procedure['code']=[convertIdcode(bio['procedure']['code']['id'],bio['procedure']['code']['label'])]
-            if 'bodySite' in bio['procedure']:
-                procedure['body_site']=[convertIdcode(bio['procedure']['bodySite']['id'],bio['procedure']['bodySite']['label'])]
-            biosample['procedure']=[procedure]
-        if 'htsFiles' in bio:
-            biosample['htsfile']=convertHtsFiles(bio['htsFiles'])
-        if 'variants' in bio:
-            biosample['variants']=convertVariants(bio['variants'])
-        if 'isControlSample' in bio:
-            biosample['is_control_sample']=[bio['isControlSample']]
-        else:
-            biosample['is_control_sample']=[False]
-        biosamples.append(biosample)
-    return biosamples
 
+@instrumented()
+@deduplicated
+def convertPheno(jsonint:json,ff:bool)->json:
+    return _mapPheno(jsonint,ff)
+
+@instrumented()
+@deduplicated
+def convertFamily(jsonint:json,ff:bool)->json:
+    return _mapFamily(jsonint,ff)
+
+@instrumented()
+@deduplicated
+def convertMeta(jsonmeta:json,ff:bool)->json:
+    #workaround to buggy phenopacket(member) in cohort that has a void metadata
+    if not jsonmeta:
+        return {}
+    return _mapMeta(jsonmeta,ff)
+
+@instrumented('features')
+def convertPhenotypicfeatures(jsonphenot:list,ff:bool)->list:
+    return [_mapPhenotypicfeature(phen,ff) for phen in jsonphenot]
+
+@instrumented('biosamples')
+def convertBiosamples(jsonbio:list,ff:bool)->list:
+    return [_mapBiosample(bio,ff) for bio in jsonbio]
 
+@instrumented('htsfiles')
 def convertHtsFiles(jsonhts:list,ff:bool)->list:
-    hts_files=[]
-    for hts in jsonhts:
-        htsfile={}
-        htsfile['uri']=[hts['uri']]
-        htsfile['htsFormat']=[{'|code':hts['htsFormat']}]
-        htsfile['genome_assembly']=[hts['genomeAssembly']]
-        if 'description' in hts:
-            htsfile['description']=[hts['description']]
-        if 'individualToSampleIdentifiers' in hts:
-            key=list(hts['individualToSampleIdentifiers'].keys())[0]
-            value=hts['individualToSampleIdentifiers'][key]
-            htsfile['individual_identifier']=[convertId(key,ff)]
-            htsfile['sample_identifier']=[convertId(value,ff)]
-        hts_files.append(htsfile)
-    return hts_files
-
-def convertVariants(jsonv:list,ff)->list:
-    zygo=False
-    variant={}
-    for vart in jsonv:
-        if 'zygosity' in vart and not zygo:
-            variant['zygosity']=[convertIdcode(vart['zygosity']['id'],vart['zygosity']['label'])]
-        if 'hgvsAllele' in vart:
-            hgvs={}
-            if 'id' in vart['hgvsAllele']:
-                hgvs['id']=[convertId(vart['hgvsAllele']['id'],ff)]
-            hgvs['hgvs']=[vart['hgvsAllele']['hgvs']]
-            variant['hgvsallele']=[hgvs]
-        if 'vcfAllele' in vart:
-            vcfa={}
-            if 'id' in vart['vcfAllele']:
-                vcfa['id']=[convertId(vart['vcfAllele']['id'],ff)]
-            vcfa['genome_assembly']=[vart['vcfAllele']['genomeAssembly']]
-            vcfa['chr']=[vart['vcfAllele']['chr']]
-            vcfa['pos']=[vart['vcfAllele']['pos']]
-            vcfa['re']=[vart['vcfAllele']['ref']]
-            vcfa['alt']=[vart['vcfAllele']['alt']]
-            vcfa['info']=[vart['vcfAllele']['info']]
-            variant['vcfallele']=[vcfa]
-        if 'spdiAllele' in vart:
-            spdi={}
-            if 'id' in vart['spdiAllele']:
-                spdi['id']=[convertId(vart['spdiAllele']['id'],ff)]
-            spdi['seq_id']=[convertId(vart['spdiAllele']['seqId'],ff)]
-            spdi['position']=[vart['spdiAllele']['position']]
-            spdi['deleted_sequence']=[vart['spdiAllele']['deletedSequence']]
-            spdi['inserted_sequence']=[vart['spdiAllele']['insertedSequence']]
-            variant['spdiallele']=[spdi]
-        if 'iscnAllele' in vart:
-            iscn={}
-            if 'id' in vart['iscnAllele']:
-                iscn['id']=[convertId(vart['iscnAllele']['id'],ff)]
-            iscn['iscn']=[vart['iscnAllele']['iscn']]
-            variant['iscnallele']=[iscn]
-    variants=[variant]
-    return variants
+    return [_mapHtsFile(hts,ff) for hts in jsonhts]
 
+@instrumented('variants')
+def convertVariants(jsonv:list,ff:bool)->list:
+    #only the last variant holding each allele reaches the node: the variants
+    #are merged first (a dict update per variant) and the merge is mapped once,
+    #instead of mapping every allele of every variant to overwrite it
+    merged={}
+    for vart in jsonv:
+        merged.update(vart)
+    return [_mapVariant(merged,ff)]
 
+@instrumented('genes')
 def convertGenes(jsongenes:list,ff:bool)->list:
-    genes=[]
-    for ge in jsongenes:
-        gene={}
-        gene['gene_symbol']=[convertIdcode(ge['id'],ge['symbol'])]
-        genes.append(gene)
-    return genes
+    return [_mapGene(ge,ff) for ge in jsongenes]
 
+@instrumented('diseases')
 def convertDiseases(jsondiseases:list,ff:bool)->list:
-    diseases=[]
-    for dis in jsondiseases:
-        disease={}
-        disease['term']=[convertIdcode(dis['term']['id'],dis['term']['label'])]
-        if 'ageOfOnset' in dis:
-            disease['onset']=[{'duration_value':[dis['ageOfOnset']['age']]}]
-        if 'tumorStage' in dis:
-            tumor_stage=[]
-            for tum in dis['tumorStage']:
-                tumor_stage.append(convertIdcode(tum['id'],tum['label']))
-            disease['tumor_stage']=tumor_stage
-        diseases.append(disease)
-    return diseases
+    return [_mapDisease(dis,ff) for dis in jsondiseases]
 
+@instrumented()
 def convertDiagnosis(diag:json,ff:bool)->json:
-    diagnoses=[]
-    for dia in diag:
-        diagnosis={}
-        diagnosis['disease']=convertDiseases([dia['disease']],ff)
-        diagnosis['genomic_interpretation']=[convertGenomicInterpretations(dia['genomicInterpretations'],ff)]
-        diagnoses.append(diagnosis)
-    return diagnoses
+    return [_mapDiagnosis(dia,ff) for dia in diag]
+
+@instrumented('persons')
+def convertPedigree(jsonped:json,ff:bool)->json:
+    return _mapPedigree(jsonped,ff)
 
+def _column(values:list,convert)->list:
+    '''the node convert(value) of each value of a column, converted once per
+    distinct value (and copied per row if the terms are copied)'''
+    converted={value:_finish(convert(value)) for value in dict.fromkeys(values)}
+    if _terms['copy']:
+        return [converted[value].copy() for value in values]
+    return [converted[value] for value in values]
 
+def convertPersons(persons:list,ff:bool)->list:
+    #a big pedigree is mapped a column at a time: the family id is the same for
+    #all the persons, the parents' ids, the sex and the affected status repeat.
+    #The ids bypass the term cache, that the individual ids would only flush
+    def ids(key:str)->list:
+        return _column([person[key] for person in persons],lambda idf: _convertId(idf,ff))
+    family,individual,paternal,maternal=ids('familyId'),ids('individualId'),ids('paternalId'),ids('maternalId')
+    sex=_column([person['sex'] for person in persons],
+        lambda v: {'|code':'at0009','|ordinal':0,'|value':v} if ff else {'|value':v})
+    affected=_column([person['affectedStatus'] for person in persons],lambda v: {'|code':v})
+    if _nodes['compact']:
+        return rows(('family_id','individual_id','paternal_id','maternal_id','sex','affected_status'),
+            [family,individual,paternal,maternal,sex,affected])
+    return [{'family_id':[f],'individual_id':[i],'paternal_id':[p],'maternal_id':[m],'sex':[s],'affected_status':[a]}
+        for f,i,p,m,s,a in zip(family,individual,paternal,maternal,sex,affected)]
+
+
+@instrumented()
 def convertGenomicInterpretations(genom:json,ff:bool)->json:
+    #pack all the interpretations into one: the status of the first one, the
+    #gene of the last one with a gene and the variants of all of them folded
+    #in one node, as convertVariants does
     genint={}
-    statusGI=False
-    statusGENE=False
-    statusVARIANT=False
-    #pack all the interpretations into one
-    for geno in genom:
-        if not statusGI:
-            gist={}
-            if ff:
-                gist['|code']='at0005'
-                gist['|ordinal']=0
-            gist['|value']=geno['status']
-            genint['genomicinterpretation_status']=[gist]
-            statusGI=True
-        if 'gene' in geno:
-            if not statusGENE:
-                genint['gene']=convertGenes([geno['gene']],ff)
-                statusGENE=True
-            else:
-                gendict=convertGenes([geno['gene']],ff)[0]
-                genint['gene'][0].update(gendict)
-        if 'variant' in geno:
-            if not statusVARIANT:
-                genint['variant']=convertVariants([geno['variant']],ff)
-                statusVARIANT=True
-            else:
-                gendict=convertVariants([geno['variant']],ff)[0]
-                genint['variant'][0].update(gendict)
-    return genint
+    if not genom:
+        return _finish(genint)
+    gist={}
+    if ff:
+        gist['|code']='at0005'
+        gist['|ordinal']=0
+    gist['|value']=genom[0]['status']
+    genint['genomicinterpretation_status']=[gist]
+    genes=[geno['gene'] for geno in genom if 'gene' in geno]
+    if genes:
+        genint['gene']=[_mapGene(genes[-1],ff)]
+    variants=[geno['variant'] for geno in genom if 'variant' in geno]
+    if variants:
+        genint['variant']=convertVariants(variants,ff)
+    return _finish(genint)
 
-def convertPedigree(jsonped:json,ff:bool)->json:
-    pedigree={}
-    persons=[]
-    for per in jsonped['persons']:
-        person={}
-        person['family_id']=[convertId(per['familyId'],ff)]
-        person['individual_id']=[convertId(per['individualId'],ff)]
-        person['paternal_id']=[convertId(per['paternalId'],ff)]
-        person['maternal_id']=[convertId(per['maternalId'],ff)]
-        sex={}
-        if ff:
-            sex['|code']='at0009'
-            sex['|ordinal']=0
-        sex['|value']=per['sex']
-        person['sex']=[sex]
-        person['affected_status']=[{'|code':per['affectedStatus']}]
-        persons.append(person)
-    pedigree['person']=persons
-    return pedigree
\ No newline at end of file
+configure_nodes()
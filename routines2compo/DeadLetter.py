@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+'''dead letter file of a batch: one json line
+    {"phenopacket","composition","error","time"}
+for every phenopacket that could not be converted, written as soon as the
+failure happens so that it survives an interrupted run.
+A later run can retry only the phenopackets listed there.
+The records of the bulk ndjson mode that fail get a line
+    {"record":"<input file>:<line number>","output","error","time"}
+in a dead letter file of their own (NDJSON_DEADLETTER by default): they are
+not phenopacket files, --retry-failed skips them'''
+import json
+import logging
+import time
+
+DEADLETTER='./phenopacket_2_compositions_structured.deadletter'
+NDJSON_DEADLETTER='./phenopacket_2_compositions_structured.ndjson.deadletter'
+
+
+def load_dead_letters(path:str)->list:
+    '''the entries of the dead letter file path, [] if there is none'''
+    entries=[]
+    try:
+        with open(path,'r') as f:
+            for n,line in enumerate(f,1):
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    #a line cut by an interrupted run
+                    logging.warning(f'{path}:{n} skipped: {e}')
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+class DeadLetterFile:
+    '''append only writer of the dead letter file.
+    pending=entries of a previous dead letter being retried: those neither
+    added again nor marked done are written back on close, so that a retry
+    interrupted halfway does not forget the phenopackets it did not reach'''
+    def __init__(self,path:str,pending:list=()):
+        self.path=path
+        self.count=0
+        self.pending={entry['phenopacket']:entry for entry in pending}
+        self.f=open(path,'w')
+
+    def add(self,filename:str,outputfile:str,error:str)->None:
+        self.pending.pop(filename,None)
+        self._write({'phenopacket':filename,'composition':outputfile,'error':error,
+            'time':time.strftime('%Y-%m-%dT%H:%M:%S')})
+
+    def add_record(self,where:str,outputfile:str,error:str)->None:
+        '''the ndjson record where (<input file>:<line number>) written in outputfile failed'''
+        self._write({'record':where,'output':outputfile,'error':error,'time':time.strftime('%Y-%m-%dT%H:%M:%S')})
+
+    def done(self,filename:str)->None:
+        self.pending.pop(filename,None)
+
+    def _write(self,entry:dict)->None:
+        self.f.write(json.dumps(entry)+'\n')
+        self.f.flush()
+        self.count+=1
+
+    def close(self)->None:
+        for entry in self.pending.values():
+            self._write(entry)
+        self.pending={}
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc)->bool:
+        self.close()
+        return False
@@ -1,17 +1,126 @@
 #!/usr/bin/python3
-'''Find all json compositions given a path'''
+'''Find all json compositions given a path.
+Each directory is listed once with os.scandir and its phenopackets are paired
+with their sidecars from that same listing: json files without .ctxinfo/.context
+(own or shared) and compositions written by a previous run are left out.
+Subtrees can be listed by a pool of threads, which hides the latency of
+network filesystems'''
 import logging
 import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from routines2compo.SidecarCache import SHARED, find_sidecar
+from routines2compo.Instrumentation import stage
+
+OUTPUT_PREFIX='COMPOSITION_FROM'
+
+PhenopacketFiles=namedtuple('PhenopacketFiles',['root','file','ctxinfo','context','target'])
+
+
+def phenopacket_files(filename:str)->PhenopacketFiles:
+    '''the PhenopacketFiles of a phenopacket not found by a walk (a retried or
+    served one): its sidecars and target are looked up on disk, None if missing'''
+    target=filename[:-4]+'target'
+    return PhenopacketFiles(os.path.dirname(filename),os.path.basename(filename),find_sidecar(filename,'ctxinfo'),
+        find_sidecar(filename,'context'),target if os.path.isfile(target) else None)
+
+
+def input_roots(paths:list)->list:
+    '''paths without the duplicates and the paths inside another one of them:
+    the walk of the outer path already finds their phenopackets. The order is kept'''
+    absolute=[os.path.abspath(path) for path in paths]
+    roots=[]
+    for i,(path,root) in enumerate(zip(paths,absolute)):
+        if root in absolute[:i]:
+            logging.info(f'input path {path} listed twice: walked once')
+            continue
+        outer=next((other for other in absolute if other!=root and os.path.commonpath([root,other])==other),None)
+        if outer is not None:
+            print (f'input path {path} is inside {outer}: its phenopackets are found there')
+            logging.info(f'input path {path} is inside {outer}: its phenopackets are found there')
+            continue
+        roots.append(path)
+    return roots
+
+
 def find_phenopackets(path:str)->dict:
     jsons = {}
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            if file.endswith('.json'):
-                absroot=os.path.abspath(root)
-                if absroot in jsons.keys():
-                    logging.debug(f'file found {jsons[absroot]}')
-                    jsons[absroot].append(file)
+    for found in iter_phenopackets(path):
+        if found.root in jsons.keys():
+            logging.debug(f'file found {jsons[found.root]}')
+            jsons[found.root].append(found.file)
+        else:
+            jsons[found.root]=[found.file]
+            logging.info(f'file found {jsons[found.root]}')
+    return jsons
+
+
+def iter_phenopackets(path:str,workers:int=1):
+    '''yield a PhenopacketFiles for every convertible phenopacket under path
+    as soon as its directory has been listed. With workers>1 directories are
+    listed concurrently and the order is not the os.walk one'''
+    if workers<=1:
+        pending=[os.path.abspath(path)]
+        while pending:
+            found,subdirs=_scan(pending.pop())
+            yield from found
+            #depth first, in listing order, as os.walk does
+            pending.extend(reversed(subdirs))
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running={executor.submit(_scan,os.path.abspath(path))}
+        while running:
+            done,running=wait(running,return_when=FIRST_COMPLETED)
+            for future in done:
+                found,subdirs=future.result()
+                for subdir in subdirs:
+                    running.add(executor.submit(_scan,subdir))
+                yield from found
+
+
+def _scan(root:str)->tuple:
+    '''list root once: (phenopackets found with their sidecars,subdirectories)'''
+    with stage('scan',file=root) as counters:
+        found,subdirs=_list(root)
+        counters['directories']=1
+        counters['phenopackets']=len(found)
+    return found,subdirs
+
+
+def _list(root:str)->tuple:
+    names=set()
+    subdirs=[]
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
                 else:
-                    jsons[absroot]=[file]
-                    logging.info(f'file found {jsons[absroot]}')
-    return jsons
\ No newline at end of file
+                    names.add(entry.name)
+    except OSError as e:
+        logging.warning(f'cannot list {root}: {e}')
+        return [],[]
+    subdirs.sort()
+    found=[]
+    for name in sorted(names):
+        if not name.endswith('.json'):
+            continue
+        if name.startswith(OUTPUT_PREFIX):
+            logging.debug(f'skipping composition {root}/{name}')
+            continue
+        stem=name[:-4]
+        sidecars=[]
+        for ext in ('ctxinfo','context'):
+            if stem+ext in names:
+                sidecars.append(os.path.join(root,stem+ext))
+            elif SHARED+'.'+ext in names:
+                sidecars.append(os.path.join(root,SHARED+'.'+ext))
+            else:
+                sidecars.append(None)
+        if None in sidecars:
+            logging.warning(f'skipping {root}/{name}: no .ctxinfo/.context sidecar')
+            continue
+        target=os.path.join(root,stem+'target') if stem+'target' in names else None
+        found.append(PhenopacketFiles(root,name,sidecars[0],sidecars[1],target))
+    return found,subdirs
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+'''timing and counters of the conversion stages.
+Disabled by default: a disabled stage costs one global lookup.
+When enabled every stage (find, read, validate, each convert* mapper, write,
+check...) records its wall time and counters (bytes read/written, members,
+features, variants...) aggregated per stage and per file. Mapper times are
+inclusive of the mappers they call.
+Hooks registered with add_hook receive every event as a dict
+    {'stage','file','pid','start','duration','counters'}
+in the process where the stage ran (pool workers inherit the hooks registered
+before the pool is started, with the fork start method).
+Events of worker processes are taken with drain() and merged in the parent
+with merge()'''
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+enabled=False
+tracing=False
+_hooks=[]
+_events=[]
+_totals=defaultdict(lambda: {'calls':0,'seconds':0.0,'counters':defaultdict(int)})
+_perfile=defaultdict(lambda: defaultdict(lambda: {'calls':0,'seconds':0.0,'counters':defaultdict(int)}))
+_current={'file':None}
+_lock=threading.Lock()
+
+
+def enable(trace:bool=False)->None:
+    global enabled,tracing
+    enabled=True
+    tracing=trace
+
+
+def add_hook(func)->None:
+    _hooks.append(func)
+
+
+def set_file(filename:str)->None:
+    '''file the following stages are attributed to'''
+    _current['file']=filename
+
+
+class _Stage:
+    __slots__=('name','file','counters','start')
+
+    def __init__(self,name:str,file:str,counters:dict):
+        self.name=name
+        self.file=file
+        self.counters=counters
+
+    def __enter__(self)->dict:
+        self.start=time.perf_counter()
+        return self.counters
+
+    def __exit__(self,*exc)->bool:
+        _record(self.name,self.file,self.start,time.perf_counter()-self.start,self.counters)
+        return False
+
+
+class _NoStage:
+    __slots__=()
+
+    def __enter__(self)->dict:
+        return {}
+
+    def __exit__(self,*exc)->bool:
+        return False
+
+_NOSTAGE=_NoStage()
+
+
+def stage(name:str,file:str=None,**counters):
+    '''context manager timing the stage name; the dict it returns can be
+    filled with counters by the body'''
+    if not enabled:
+        return _NOSTAGE
+    return _Stage(name,file or _current['file'],counters)
+
+
+def count(name:str,value:int,file:str=None)->None:
+    '''add value to the counter name outside of any stage'''
+    if enabled:
+        _record('counters',file or _current['file'],time.perf_counter(),0.0,{name:value})
+
+
+def instrumented(counter:str=None):
+    '''decorator timing a mapper. counter=name under which the elements handled are
+    counted: len(first argument) if it is a list, len(first argument[counter]) if a dict'''
+    def decorate(func):
+        name=func.__name__
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            if not enabled:
+                return func(*args,**kwargs)
+            counters={}
+            if counter is not None and args:
+                if isinstance(args[0],list):
+                    counters[counter]=len(args[0])
+                elif isinstance(args[0],dict) and counter in args[0]:
+                    counters[counter]=len(args[0][counter])
+            with _Stage(name,_current['file'],counters):
+                return func(*args,**kwargs)
+        return wrapper
+    return decorate
+
+
+def _record(name:str,file:str,start:float,duration:float,counters:dict)->None:
+    event={'stage':name,'file':file,'pid':os.getpid(),'start':start,'duration':duration,'counters':counters}
+    _add(event)
+    for hook in _hooks:
+        try:
+            hook(event)
+        except Exception as e:
+            logging.warning(f'instrumentation hook {hook} failed: {e}')
+
+
+def _add(event:dict)->None:
+    with _lock:
+        _aggregate(event)
+        if tracing:
+            _events.append(event)
+
+
+def _aggregate(event:dict)->None:
+    for agg in (_totals[event['stage']],_perfile[event['file']][event['stage']]):
+        agg['calls']+=1
+        agg['seconds']+=event['duration']
+        for k,v in event['counters'].items():
+            agg['counters'][k]+=v
+
+
+def drain()->list:
+    '''events recorded so far in this process, to be merged in the parent.
+    The local aggregates are reset'''
+    events=[]
+    for file,stages in _perfile.items():
+        for name,agg in stages.items():
+            events.append({'stage':name,'file':file,'pid':os.getpid(),'calls':agg['calls'],
+                'duration':agg['seconds'],'counters':dict(agg['counters'])})
+    trace=list(_events)
+    reset()
+    return [events,trace]
+
+
+def merge(drained:list)->None:
+    '''add the events drained in another process'''
+    if not drained:
+        return
+    events,trace=drained
+    with _lock:
+        for event in events:
+            for agg in (_totals[event['stage']],_perfile[event['file']][event['stage']]):
+                agg['calls']+=event['calls']
+                agg['seconds']+=event['duration']
+                for k,v in event['counters'].items():
+                    agg['counters'][k]+=v
+        if tracing:
+            _events.extend(trace)
+
+
+def reset()->None:
+    _totals.clear()
+    _perfile.clear()
+    _events.clear()
+
+
+def summary()->dict:
+    '''{'stages':{stage:aggregate},'files':{file:{stage:aggregate}}}'''
+    def plain(agg):
+        return {'calls':agg['calls'],'seconds':agg['seconds'],'counters':dict(agg['counters'])}
+    return {
+        'stages':{name:plain(agg) for name,agg in _totals.items()},
+        'files':{str(file):{name:plain(agg) for name,agg in stages.items()} for file,stages in _perfile.items()}
+    }
+
+
+def format_summary()->str:
+    lines=[f'{"stage":<28}{"calls":>10}{"seconds":>12}  counters']
+    for name,agg in sorted(_totals.items(),key=lambda x: -x[1]['seconds']):
+        counters=', '.join(f'{k}={v}' for k,v in sorted(agg['counters'].items()))
+        lines.append(f'{name:<28}{agg["calls"]:>10}{agg["seconds"]:>12.4f}  {counters}')
+    return '\n'.join(lines)
+
+
+def write_report(path:str)->None:
+    with open(path,'w') as f:
+        json.dump(summary(),f,indent=4)
+
+
+def write_chrome_trace(path:str)->None:
+    '''events in the Trace Event Format read by chrome://tracing and Perfetto'''
+    trace=[{'name':e['stage'],'cat':'conversion','ph':'X','ts':e['start']*1e6,'dur':e['duration']*1e6,
+        'pid':e['pid'],'tid':e['pid'],'args':dict(e['counters'],file=e['file'])} for e in _events]
+    with open(path,'w') as f:
+        json.dump({'traceEvents':trace,'displayTimeUnit':'ms'},f)
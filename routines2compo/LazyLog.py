@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+'''lazy logging of big json payloads.
+The payload is serialized only if the record is really emitted, optionally
+truncated after a number of characters (the serialization itself stops there)
+and optionally sampled, logging only one payload every N'''
+import json
+import logging
+
+#max characters of a payload in the log (None=no limit)
+max_chars=None
+#log one payload every sample
+sample=1
+_seen=0
+
+
+def configure(maxchars:int=None,every:int=1)->None:
+    global max_chars,sample,_seen
+    max_chars=maxchars
+    sample=max(1,every)
+    _seen=0
+
+
+class LazyJson:
+    '''json.dumps(obj,**kwargs) computed when converted to str'''
+    __slots__=('obj','kwargs','limit')
+
+    def __init__(self,obj,limit:int=None,**kwargs):
+        self.obj=obj
+        self.kwargs=kwargs
+        self.limit=limit
+
+    def __str__(self)->str:
+        if self.limit is None:
+            return json.dumps(self.obj,**self.kwargs)
+        chunks=[]
+        size=0
+        for chunk in json.JSONEncoder(**self.kwargs).iterencode(self.obj):
+            chunks.append(chunk)
+            size+=len(chunk)
+            if size>self.limit:
+                return ''.join(chunks)[:self.limit]+f'\n... [truncated after {self.limit} characters]'
+        return ''.join(chunks)
+
+
+def log_json(level:int,header:str,obj,sampled:bool=False,**kwargs)->None:
+    '''log header and obj serialized with kwargs at level, paying nothing
+    if level is disabled. sampled payloads obey the sampling rate'''
+    global _seen
+    logger=logging.getLogger()
+    if not logger.isEnabledFor(level):
+        return
+    if sampled:
+        _seen+=1
+        if (_seen-1)%sample:
+            return
+    logger.log(level,'%s\n%s',header,LazyJson(obj,max_chars,**kwargs))
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+'''manifest of the conversions already done, used to skip unchanged inputs.
+For each phenopacket it records size, mtime and sha256 of the phenopacket,
+of its .ctxinfo/.context sidecars and of the composition produced.
+A file whose size and mtime did not change is trusted without hashing it;
+if only the mtime changed the content hash decides.
+The settings of a manifest include the fingerprint of the converter code: a
+manifest made by another release is not trusted'''
+import functools
+import hashlib
+import json
+import logging
+import os
+
+from routines2compo.FindPhenopackets import PhenopacketFiles, phenopacket_files
+
+MANIFEST='./phenopacket_2_compositions_structured.manifest'
+VERSION=1
+
+
+@functools.lru_cache(maxsize=None)
+def converter_fingerprint()->str:
+    '''sha256 of the sources of the converter (the routines2compo modules)'''
+    h=hashlib.sha256()
+    package=os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package)):
+        if name.endswith('.py'):
+            h.update(name.encode())
+            h.update(bytes.fromhex(file_hash(os.path.join(package,name))))
+    return h.hexdigest()
+
+
+def manifest_settings(outputformat:str)->dict:
+    '''the settings a manifest is valid for'''
+    return {'output_format':outputformat,'converter':converter_fingerprint()}
+
+
+def file_hash(path:str)->str:
+    h=hashlib.sha256()
+    with open(path,'rb') as f:
+        for block in iter(lambda: f.read(1<<20),b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint(path:str,previous:dict=None)->dict:
+    '''size/mtime/hash of path. The hash of previous is reused if size and mtime match'''
+    st=os.stat(path)
+    if previous is not None and previous['path']==path and previous['size']==st.st_size \
+            and previous['mtime_ns']==st.st_mtime_ns:
+        return dict(previous)
+    return {'path':path,'size':st.st_size,'mtime_ns':st.st_mtime_ns,'sha256':file_hash(path)}
+
+
+def unchanged(fp:dict)->bool:
+    try:
+        st=os.stat(fp['path'])
+    except OSError:
+        return False
+    if st.st_size!=fp['size']:
+        return False
+    if st.st_mtime_ns==fp['mtime_ns']:
+        return True
+    #touched but maybe not modified
+    if file_hash(fp['path'])!=fp['sha256']:
+        return False
+    fp['mtime_ns']=st.st_mtime_ns
+    return True
+
+
+def manifest_entry(filename:str,outputfile:str,previous:dict=None,files:PhenopacketFiles=None)->dict:
+    '''fingerprints of the inputs of filename (files: its sidecars, looked up
+    if not given) and of the composition outputfile'''
+    previous=previous or {}
+    files=files or phenopacket_files(filename)
+    oldinputs=previous.get('inputs',{})
+    inputs={'phenopacket':fingerprint(filename,oldinputs.get('phenopacket'))}
+    for ext in ('ctxinfo','context'):
+        sidecar=getattr(files,ext)
+        if sidecar is not None:
+            inputs[ext]=fingerprint(sidecar,oldinputs.get(ext))
+    return {'inputs':inputs,'output':fingerprint(outputfile)}
+
+
+def is_current(manifest:dict,filename:str,outputfile:str,files:PhenopacketFiles=None)->bool:
+    '''True if filename was already converted into outputfile and nothing changed since'''
+    return entry_is_current(manifest['files'].get(filename),filename,outputfile,files)
+
+
+def entry_is_current(entry:dict,filename:str,outputfile:str,files:PhenopacketFiles=None)->bool:
+    '''is_current of the manifest entry of filename (None if it has none)'''
+    if entry is None or entry['output']['path']!=outputfile:
+        return False
+    files=files or phenopacket_files(filename)
+    for ext in ('ctxinfo','context'):
+        #a sidecar appeared, disappeared or is now resolved to another file
+        recorded=entry['inputs'].get(ext)
+        if (recorded and recorded['path'])!=getattr(files,ext):
+            return False
+    return all(unchanged(fp) for fp in entry['inputs'].values()) and unchanged(entry['output'])
+
+
+def load_manifest(path:str=MANIFEST,settings:dict=None)->dict:
+    '''the manifest in path or an empty one if missing, unreadable or made with other settings'''
+    settings=settings or {}
+    empty={'version':VERSION,'settings':settings,'files':{}}
+    try:
+        with open(path,'r') as f:
+            manifest=json.load(f)
+    except FileNotFoundError:
+        return empty
+    except (OSError,ValueError) as e:
+        logging.warning(f'manifest {path} unreadable ({e}): everything will be converted')
+        return empty
+    if manifest.get('version')!=VERSION or manifest.get('settings')!=settings:
+        logging.info(f'manifest {path} made with other settings: everything will be converted')
+        return empty
+    return manifest
+
+
+def save_manifest(manifest:dict,path:str=MANIFEST)->None:
+    #write aside and rename so that a crash never leaves a truncated manifest
+    tmp=path+'.tmp'
+    with open(tmp,'w') as f:
+        json.dump(manifest,f,indent=1)
+    os.replace(tmp,path)
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+'''declarative mapping of a phenopacket record onto a composition node.
+A record is mapped by a table of Fields:
+    Field(source,target,transform,default)
+    -source: key of the phenopacket record, a dotted path (subject.id: the
+     first key may be missing, the others are then required) or '' for the
+     whole record
+    -target: key of the composition node, or None if the transform yields a
+     dict of several keys to merge in the node
+    -transform: how the value is converted (VALUE, ID, TERM, one(...), ...)
+    -default: REQUIRED (a missing source raises KeyError), OPTIONAL (a missing
+     source leaves the target out) or the value the target takes when the
+     source is missing (a list is copied for each record)
+compile_record turns a table into a function: the paths and the converters of
+the fields are worked out once, the function only walks them. The functions
+the transforms call (convertId, convertIdcode, the mappers named in
+one/many/call...) are looked up by name in the namespace given, at call time,
+so that the mappers can be compiled in any order and reconfigured.
+A compiled record is called as record(src,ff,out=None): the fields are set in
+out (a new dict by default) which is returned, or finish(out) if the record is
+compiled with a finish function (e.g. CompactComposition.node)'''
+from collections import namedtuple
+
+Field=namedtuple('Field',['source','target','transform','default'])
+#a transform is a function bind(namespace)->convert(v,ff), the value stored in
+#the target (OMIT: the target is left out)
+Transform=namedtuple('Transform',['name','bind'])
+
+REQUIRED='required'
+OPTIONAL='optional'
+MISSING=object()
+OMIT=object()
+
+
+def field(source:str,target:str,transform:Transform,default=OPTIONAL)->Field:
+    return Field(source,target,transform,default)
+
+
+def _plain(name:str,convert)->Transform:
+    '''a transform calling nothing of the namespace'''
+    return Transform(name,lambda namespace: convert)
+
+
+#[value]
+VALUE=_plain('VALUE',lambda v,ff: [v])
+#[duration] of an Age
+AGE=_plain('AGE',lambda v,ff: [{'duration_value':[v['age']]}])
+#[code] of an enum
+CODE=_plain('CODE',lambda v,ff: [{'|code':v}])
+
+def _id(namespace:dict):
+    def convert(v,ff):
+        return [namespace['convertId'](v,ff)]
+    return convert
+
+#[identifier node]
+ID=Transform('ID',_id)
+
+def term(label:str)->Transform:
+    '''[coded term node] of an OntologyClass whose label is in the label key'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            return [namespace['convertIdcode'](v['id'],v[label])]
+        return convert
+    return Transform(f'term({label})',bind)
+
+#[coded term node] of an OntologyClass
+TERM=term('label')
+
+def _terms(namespace:dict):
+    def convert(v,ff):
+        convertIdcode=namespace['convertIdcode']
+        return [convertIdcode(t['id'],t['label']) for t in v]
+    return convert
+
+#[coded term node,...] of a list of OntologyClass
+TERMS=Transform('TERMS',_terms)
+
+
+def coded(code:str,valuefirst:bool=False)->Transform:
+    '''[ordinal] of an enum: code and ordinal only with ff, the value after them
+    unless valuefirst'''
+    if valuefirst:
+        return _plain(f'coded({code})',lambda v,ff: [{'|value':v,'|code':code,'|ordinal':0} if ff else {'|value':v}])
+    return _plain(f'coded({code})',lambda v,ff: [{'|code':code,'|ordinal':0,'|value':v} if ff else {'|value':v}])
+
+def one(record:str)->Transform:
+    '''[record(v)]'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            return [namespace[record](v,ff)]
+        return convert
+    return Transform(f'one({record})',bind)
+
+def many(record:str)->Transform:
+    '''[record(x) for each x in v]'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            mapper=namespace[record]
+            return [mapper(x,ff) for x in v]
+        return convert
+    return Transform(f'many({record})',bind)
+
+def call(mapper:str)->Transform:
+    '''mapper(v), a mapper already returning the list'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            return namespace[mapper](v,ff)
+        return convert
+    return Transform(f'call({mapper})',bind)
+
+def single(mapper:str)->Transform:
+    '''mapper([v]), a list mapper applied to one value'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            return namespace[mapper]([v],ff)
+        return convert
+    return Transform(f'single({mapper})',bind)
+
+def nonempty(record:str)->Transform:
+    '''[record(v)], left out if the node is empty'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            element=namespace[record](v,ff)
+            return [element] if element else OMIT
+        return convert
+    return Transform(f'nonempty({record})',bind)
+
+def either(*choices:tuple)->Transform:
+    '''{key:[record(v[key])]} of the first (key,record) of choices whose key is
+    in v, {} if none is (the members of a oneof, target None)'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            for key,record in choices:
+                if key in v:
+                    return {key:[namespace[record](v[key],ff)]}
+            return {}
+        return convert
+    return Transform('either('+','.join(key for key,_ in choices)+')',bind)
+
+def first_pair(keytarget:str,valuetarget:str)->Transform:
+    '''{keytarget:[identifier node of the key],valuetarget:[identifier node of
+    the value]} of the first pair of a mapping, {} if it is empty (target None)'''
+    def bind(namespace:dict):
+        def convert(v,ff):
+            convertId=namespace['convertId']
+            for key,value in v.items():
+                return {keytarget:[convertId(key,ff)],valuetarget:[convertId(value,ff)]}
+            return {}
+        return convert
+    return Transform(f'first_pair({keytarget},{valuetarget})',bind)
+
+
+def _step(f:Field,namespace:dict)->tuple:
+    '''(first key,rest of the path,required,default factory,target,convert) of f'''
+    path=f.source.split('.') if f.source else [None]
+    if f.default in (REQUIRED,OPTIONAL):
+        default=None
+    elif isinstance(f.default,list):
+        default=f.default.copy
+    else:
+        default=lambda value=f.default: value
+    return path[0],tuple(path[1:]),f.default==REQUIRED,default,f.target,f.transform.bind(namespace)
+
+
+def compile_record(name:str,fields:list,namespace:dict,finish=None):
+    '''the function mapping a record with fields, its calls resolved in namespace'''
+    steps=tuple(_step(f,namespace) for f in fields)
+    def record(src,ff,out=None):
+        if out is None:
+            out={}
+        for first,rest,required,default,target,convert in steps:
+            if first is None:
+                v=src
+            elif required:
+                v=src[first]
+            else:
+                v=src.get(first,MISSING)
+                if v is MISSING:
+                    if default is not None:
+                        out[target]=default()
+                    continue
+            for key in rest:
+                v=v[key]
+            value=convert(v,ff)
+            if target is None:
+                out.update(value)
+            elif value is not OMIT:
+                out[target]=value
+        return finish(out) if finish else out
+    record.__name__=record.__qualname__=name
+    return record
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+'''upload of the compositions to an openEHR server (EHRbase REST API):
+    POST {base}/ehr/{ehr_id}/composition?templateId=...&format=STRUCTURED
+The compositions are sent in the structured format they are produced in.
+Requests go through a pool of keep-alive connections used by a pool of
+threads. Compositions are grouped in batches: a batch is sent by one thread,
+one request after the other on the keep-alive connections (the openEHR REST
+API has no multi composition call), so that the threads are fed with little
+overhead.
+A POST is not idempotent: it is retried (with exponential backoff) only when
+the server certainly did not store it, i.e. the connection could not be made
+or the request not sent, or the answer is 429 or 503 (refused before the body
+was accepted). A timeout or a lost connection once the request is sent, any
+other 5xx and any 4xx are final: the composition may have been stored, sending
+it again could duplicate it. Pooled connections closed by the server while
+idle are dropped before they are used.
+The template of a composition is its root key (interpretation_report,
+cohort_report) unless mapped to another template id.
+Without an ehr_id one EHR is created for the run'''
+import base64
+import http.client
+import json
+import logging
+import queue
+import random
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, quote
+
+#the server refused the request without acting on it
+RETRY_STATUS={429,503}
+
+
+class UploadError(Exception):
+    pass
+
+
+class OpenEhrUploader:
+    '''submit() compositions, collect the outcomes with completed() and close()
+    at the end. Outcomes are (filename,composition uid or None,error or None)'''
+    def __init__(self,baseurl:str,ehrid:str=None,templates:dict=None,concurrency:int=4,batch:int=16,
+            retries:int=5,backoff:float=0.5,timeout:float=60):
+        url=urlsplit(baseurl)
+        if url.scheme not in ('http','https'):
+            raise ValueError(f'unsupported openEHR url {baseurl}')
+        self.connclass=http.client.HTTPSConnection if url.scheme=='https' else http.client.HTTPConnection
+        self.host=url.hostname
+        self.port=url.port
+        self.path=url.path.rstrip('/')
+        #without the credentials, for the messages
+        self.url=url._replace(netloc=url.hostname+(f':{url.port}' if url.port else '')).geturl()
+        self.headers={'Content-Type':'application/json','Accept':'application/json','Prefer':'return=minimal'}
+        if url.username:
+            credentials=f'{url.username}:{url.password or ""}'.encode()
+            self.headers['Authorization']='Basic '+base64.b64encode(credentials).decode()
+        self.templates=templates or {}
+        self.batch=max(1,batch)
+        self.retries=retries
+        self.backoff=backoff
+        self.timeout=timeout
+        self.stats={'uploaded':0,'failed':0,'retried':0,'requests':0}
+        self._statslock=threading.Lock()
+        self._pool=queue.LifoQueue()
+        self._done=queue.SimpleQueue()
+        self._pending=[]
+        #at most two batches per thread waiting: submit() blocks beyond that
+        self._slots=threading.BoundedSemaphore(concurrency*2)
+        self._executor=ThreadPoolExecutor(max_workers=concurrency,thread_name_prefix='openehr-upload')
+        self.ehrid=ehrid or self.create_ehr()
+
+    def _count(self,key:str)->None:
+        with self._statslock:
+            self.stats[key]+=1
+
+    def _connection(self):
+        while True:
+            try:
+                conn=self._pool.get_nowait()
+            except queue.Empty:
+                return self.connclass(self.host,self.port,timeout=self.timeout)
+            #readable while idle: closed by the server (the next request would
+            #be lost after being sent)
+            if conn.sock is not None and not select.select([conn.sock],[],[],0)[0]:
+                return conn
+            conn.close()
+
+    def request(self,method:str,path:str,body:bytes=None)->tuple:
+        '''(status,headers,body) of the request, retried only if the server did not act on it'''
+        for attempt in range(self.retries+1):
+            conn=self._connection()
+            sent=False
+            try:
+                self._count('requests')
+                if conn.sock is None:
+                    conn.connect()
+                conn.request(method,self.path+path,body=body,headers=self.headers)
+                sent=True
+                response=conn.getresponse()
+                data=response.read()
+            except (OSError,http.client.HTTPException) as e:
+                #the connection is not reused
+                conn.close()
+                error=f'{type(e).__name__}: {e}'
+                if sent:
+                    raise UploadError(f'{method} {path} sent but not answered, not retried (it may have been stored): {error}') from e
+                wait=None
+            else:
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._pool.put(conn)
+                if response.status not in RETRY_STATUS:
+                    return response.status,response.headers,data
+                error=f'HTTP {response.status} {data[:200].decode(errors="replace")}'
+                wait=response.headers.get('Retry-After')
+            if attempt==self.retries:
+                raise UploadError(f'{method} {path} failed after {attempt+1} attempts: {error}')
+            self._count('retried')
+            delay=float(wait) if wait and wait.isdigit() else self.backoff*2**attempt*(0.5+random.random())
+            logging.warning(f'{method} {path}: {error}, retrying in {delay:.1f}s')
+            time.sleep(delay)
+
+    def create_ehr(self)->str:
+        status,headers,data=self.request('POST','/ehr',b'')
+        if status not in (200,201):
+            raise UploadError(f'cannot create an EHR: HTTP {status} {data[:200].decode(errors="replace")}')
+        if data:
+            return json.loads(data)['ehr_id']['value']
+        #return=minimal: the id is in the ETag (or at the end of the Location)
+        etag=headers.get('ETag')
+        return etag.strip('"') if etag else headers['Location'].rstrip('/').rsplit('/',1)[1]
+
+    def template_of(self,composition:dict)->str:
+        root=next(key for key in composition if not key.startswith('ctx/'))
+        return self.templates.get(root,root)
+
+    def post_composition(self,composition:dict)->str:
+        '''uid of the new composition'''
+        path=f'/ehr/{quote(self.ehrid)}/composition?templateId={quote(self.template_of(composition))}&format=STRUCTURED'
+        status,headers,data=self.request('POST',path,json.dumps(composition).encode())
+        if status not in (200,201,204):
+            raise UploadError(f'HTTP {status} {data[:500].decode(errors="replace")}')
+        etag=headers.get('ETag')
+        if etag:
+            return etag.strip('"')
+        if data:
+            return json.loads(data).get('uid',{}).get('value')
+        return headers.get('Location')
+
+    def submit(self,filename:str,composition:dict)->None:
+        self._pending.append((filename,composition))
+        if len(self._pending)>=self.batch:
+            self.flush()
+
+    def flush(self)->None:
+        if not self._pending:
+            return
+        batch,self._pending=self._pending,[]
+        self._slots.acquire()
+        future=self._executor.submit(self._send,batch)
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _send(self,batch:list)->None:
+        for filename,composition in batch:
+            try:
+                uid=self.post_composition(composition)
+            except Exception as e:
+                self._count('failed')
+                self._done.put((filename,None,f'{type(e).__name__}: {e}'))
+            else:
+                self._count('uploaded')
+                self._done.put((filename,uid,None))
+
+    def completed(self)->list:
+        '''outcomes of the uploads finished since the last call'''
+        done=[]
+        while True:
+            try:
+                done.append(self._done.get_nowait())
+            except queue.Empty:
+                return done
+
+    def close(self)->list:
+        '''send what is left, wait for all the uploads and return their outcomes'''
+        self.flush()
+        self._executor.shutdown(wait=True)
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        return self.completed()
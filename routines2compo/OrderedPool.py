@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+'''ordered map over a pool of processes, shared by the batch modes (conversion,
+--verify, --validate-only, ndjson). The results come back in the order of the
+items with at most a window of them in flight: items can be a generator walking
+millions of files, they are neither all submitted nor all kept at once.
+A worker that dies (killed by the OOM killer, a crash in an extension...)
+breaks the whole pool: the pool is started again and the items it took down
+with it are run again one at a time, so that only the item that kills its
+worker fails and the batch goes on'''
+import collections
+import itertools
+import logging
+from concurrent.futures import Future
+
+
+def init_logging_worker(loglevel:int,logfile:str)->None:
+    '''initializer of the workers: started with spawn they do not inherit the logging configuration'''
+    logging.basicConfig(filename=logfile,filemode='a',level=loglevel)
+
+
+def ordered_map(func,items,workers:int,window:int=None,initializer=None,initargs:tuple=(),failed=None):
+    '''yield (args,func(*args)) for each args tuple of items, in order, computed by
+    workers processes with at most window (default workers*4) items in flight.
+    failed(args,exception) is the result of the items whose worker process died
+    (default: the exception is raised). workers<=1: computed in this process'''
+    items=iter(items)
+    if workers<=1:
+        for args in items:
+            yield args,func(*args)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    window=window or workers*4
+    def start():
+        return ProcessPoolExecutor(max_workers=workers,initializer=initializer,initargs=initargs)
+    executor=start()
+    #[args,future,alone]: the future is None until submitted, alone once run
+    #with no other item in the pool (its BrokenProcessPool is then its own)
+    inflight=collections.deque()
+
+    def lost(future)->bool:
+        return future is None or future.cancelled() or not future.done() \
+            or isinstance(future.exception(),BrokenProcessPool)
+
+    def alone(args:tuple)->Future:
+        #the done future of args run with no other item in the pool
+        nonlocal executor
+        done=Future()
+        try:
+            done.set_result(executor.submit(func,*args).result())
+        except BrokenProcessPool as e:
+            logging.error(f'a worker died running {args[:1]}: its item fails, the pool is started again')
+            executor.shutdown(wait=False,cancel_futures=True)
+            executor=start()
+            done.set_exception(e)
+        except Exception as e:
+            done.set_exception(e)
+        return done
+
+    def recover()->None:
+        #which of the items in flight killed its worker is unknown: they are run
+        #again one by one in a new pool, the others completed before the break are kept
+        nonlocal executor
+        logging.warning(f'a worker died: the pool is started again and its {len(inflight)} items in flight run one at a time')
+        executor.shutdown(wait=False,cancel_futures=True)
+        executor=start()
+        for entry in inflight:
+            if not entry[2] and lost(entry[1]):
+                entry[1]=alone(entry[0])
+                entry[2]=True
+
+    try:
+        while True:
+            for args in itertools.islice(items,window-len(inflight)):
+                entry=[args,None,False]
+                inflight.append(entry)
+                try:
+                    entry[1]=executor.submit(func,*args)
+                except BrokenProcessPool:
+                    recover()
+            if not inflight:
+                return
+            args,future,isolated=inflight[0]
+            try:
+                result=future.result()
+            except Exception as e:
+                if isinstance(e,BrokenProcessPool) and not isolated:
+                    recover()
+                    continue
+                if failed is None:
+                    raise
+                result=failed(args,e)
+            inflight.popleft()
+            yield args,result
+    finally:
+        executor.shutdown(wait=True,cancel_futures=True)
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+'''where the composition of a phenopacket is written.
+Layouts, under the output directory (default the current one):
+    -flat: COMPOSITION_FROM<phenopacket name> (the historical layout): two
+     phenopackets with the same name in different directories get the same
+     composition, the collision is reported
+    -mirror: <name of the input root>/<directories below the root>/COMPOSITION_FROM<name>
+    -hashed: xx/yy/COMPOSITION_FROM<name>, xx and yy taken from the hash of
+     the path of the phenopacket below (the name of) its root: at most 256
+     entries per directory level, so that millions of compositions stay fast
+     to look up on ext4 or NFS; two phenopackets with the same name may still
+     share a composition, the collision is reported
+The name of an input root is the name of its directory, followed by its
+position in the list of the roots when another root has the same name
+(/a/Phenos and /b/Phenos: Phenos-1 and Phenos-2); a root that is not in the
+list (the directory of the phenopacket, in the server) is followed by the
+hash of its absolute path.
+The files are written through a temporary file renamed over the composition
+(OutputWriters.atomic_path), the directories are made as needed'''
+import collections
+import hashlib
+import logging
+import os
+
+from routines2compo.FindPhenopackets import OUTPUT_PREFIX
+
+LAYOUTS=('flat','mirror','hashed')
+
+
+class OutputLayout:
+    '''the composition path of each phenopacket found under an input root'''
+    def __init__(self,layout:str='flat',outputdir:str='.',suffix:str='',collisions:bool=True,roots:list=()):
+        if layout not in LAYOUTS:
+            raise ValueError(f'unknown output layout {layout}: choose among {", ".join(LAYOUTS)}')
+        self.layout=layout
+        self.outputdir=outputdir
+        self.suffix=suffix
+        self.roots=_root_names(roots)
+        #digests of the compositions already given, to report the collisions of
+        #the flat and hashed layouts (mirror cannot collide). It grows by one
+        #8 bytes digest per phenopacket (~60 bytes with the set, 60MB for a
+        #million files); None: not tracked (a long running server)
+        self.assigned=set() if collisions and layout!='mirror' else None
+
+    def path(self,filename:str,root:str=None)->str:
+        '''the composition of filename found under the input root (default its directory)'''
+        name=OUTPUT_PREFIX+os.path.basename(filename)+self.suffix
+        if self.layout=='flat':
+            outputfile=os.path.join(self.outputdir,name)
+        else:
+            relative=self._relative(filename,root or os.path.dirname(filename))
+            if self.layout=='mirror':
+                outputfile=os.path.join(self.outputdir,*os.path.dirname(relative).split('/'),name)
+            else:
+                h=hashlib.sha1(relative.encode('utf-8','surrogateescape')).hexdigest()
+                outputfile=os.path.join(self.outputdir,h[:2],h[2:4],name)
+        if self.assigned is None:
+            return outputfile
+        digest=hashlib.blake2b(outputfile.encode('utf-8','surrogateescape'),digest_size=8).digest()
+        if digest in self.assigned:
+            advice='use --output-layout mirror or hashed' if self.layout=='flat' else 'use --output-layout mirror'
+            print (f'{filename} is converted into {outputfile} as another phenopacket before it: {advice}')
+            logging.warning(f'{filename} is converted into {outputfile} as another phenopacket before it: the last one converted overwrites the other')
+        self.assigned.add(digest)
+        return outputfile
+
+    def _relative(self,filename:str,root:str)->str:
+        '''filename below the directory named after its root, / separated:
+        different roots never share a composition'''
+        root=os.path.abspath(root)
+        relative=os.path.relpath(os.path.abspath(filename),root).replace(os.sep,'/')
+        name=self.roots.get(root)
+        if name is None:
+            name=_name(root)+'-'+hashlib.sha1(root.encode('utf-8','surrogateescape')).hexdigest()[:8]
+        return name+'/'+relative
+
+
+def _name(root:str)->str:
+    return os.path.basename(root) or 'root'
+
+
+def _root_names(roots:list)->dict:
+    '''{absolute root:its name}: the name of its directory, followed by its
+    position in roots when another root has the same name'''
+    roots=list(dict.fromkeys(os.path.abspath(root) for root in roots))
+    counts=collections.Counter(_name(root) for root in roots)
+    taken=set(counts)
+    names={}
+    for i,root in enumerate(roots,1):
+        name=_name(root)
+        if counts[name]>1:
+            name=f'{name}-{i}'
+            while name in taken:
+                name+=f'-{i}'
+            taken.add(name)
+        names[root]=name
+    return names
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+'''serialization of the compositions on file.
+Available formats:
+    -pretty: sorted keys, 4 spaces indentation (the historical output)
+    -compact: sorted keys, no whitespace
+    -fast: like compact but encoded with orjson (needs orjson installed)
+    -gzip: compact, gzip compressed (.gz appended to the file name)
+    -zstd: compact, zstandard compressed (.zst appended, needs zstandard installed)
+All the writers go through a large write buffer, into a temporary file
+renamed over the composition once complete: an interrupted or failed write
+never leaves a partial composition, nor destroys the previous one.
+The compositions can be dicts or CompactComposition Nodes: these are written
+straight from the Nodes, with the same bytes'''
+import contextlib
+import gzip
+import io
+import itertools
+import json
+import os
+from collections import namedtuple
+
+from routines2compo import CompactComposition
+from routines2compo.CompactComposition import Node, plain
+
+try:
+    import orjson
+except ImportError:
+    orjson=None
+try:
+    import zstandard
+except ImportError:
+    zstandard=None
+
+BUFSIZE=1<<20
+
+#opener: (path,name of the final file)->binary stream, encode: obj->bytes,
+#dump: (obj,binary stream)->None, indent: used by the streaming writer
+OutputFormat=namedtuple('OutputFormat',['name','suffix','opener','encode','dump','indent'])
+
+
+def _open_plain(path:str,name:str=None):
+    return open(path,'wb',buffering=BUFSIZE)
+
+class _GzipWriter(gzip.GzipFile):
+    '''GzipFile writing into the file raw, closed with it'''
+    def __init__(self,raw,name:str):
+        super().__init__(name,'wb',compresslevel=6,fileobj=raw)
+        self._raw=raw
+
+    def close(self)->None:
+        try:
+            super().close()
+        finally:
+            self._raw.close()
+
+def _open_gzip(path:str,name:str=None):
+    #the gzip header records the name of the composition, not the one of the temporary file
+    return io.BufferedWriter(_GzipWriter(open(path,'wb'),name or path),buffer_size=BUFSIZE)
+
+def _open_zstd(path:str,name:str=None):
+    return io.BufferedWriter(zstandard.ZstdCompressor().stream_writer(open(path,'wb'),closefd=True),buffer_size=BUFSIZE)
+
+def _encode_pretty(obj)->bytes:
+    if isinstance(obj,Node):
+        return CompactComposition.encode(obj,4).encode()
+    return json.dumps(obj,sort_keys=True,indent=4).encode()
+
+def _dump_pretty(obj,out)->None:
+    if isinstance(obj,Node):
+        CompactComposition.dump(obj,out,4)
+        return
+    #json.dump writes the indented output chunk by chunk instead of building it whole
+    text=io.TextIOWrapper(out,encoding='utf-8')
+    json.dump(obj,text,sort_keys=True,indent=4)
+    text.flush()
+    text.detach()
+
+def _encode_compact(obj)->bytes:
+    if isinstance(obj,Node):
+        return CompactComposition.encode(obj).encode()
+    return json.dumps(obj,sort_keys=True,separators=(',',':')).encode()
+
+def _encode_fast(obj)->bytes:
+    #orjson expands the Nodes it meets, one at a time
+    return orjson.dumps(obj,default=plain,option=orjson.OPT_SORT_KEYS)
+
+def _dump_encoded(encode):
+    def dump(obj,out)->None:
+        out.write(encode(obj))
+    return dump
+
+
+FORMATS={
+    'pretty':OutputFormat('pretty','',_open_plain,_encode_pretty,_dump_pretty,4),
+    'compact':OutputFormat('compact','',_open_plain,_encode_compact,_dump_encoded(_encode_compact),None),
+    'fast':OutputFormat('fast','',_open_plain,_encode_fast,_dump_encoded(_encode_fast),None),
+    'gzip':OutputFormat('gzip','.gz',_open_gzip,_encode_compact,_dump_encoded(_encode_compact),None),
+    'zstd':OutputFormat('zstd','.zst',_open_zstd,_encode_compact,_dump_encoded(_encode_compact),None),
+}
+
+
+def get_format(name:str)->OutputFormat:
+    '''the OutputFormat called name, ValueError if unknown or its backend is not installed'''
+    if name not in FORMATS:
+        raise ValueError(f'unknown output format {name}: choose among {", ".join(FORMATS)}')
+    if name=='fast' and orjson is None:
+        raise ValueError('output format fast needs the orjson package')
+    if name=='zstd' and zstandard is None:
+        raise ValueError('output format zstd needs the zstandard package')
+    return FORMATS[name]
+
+
+#directories already made by atomic_path
+_made=set()
+_tmpcount=itertools.count()
+
+def make_directory(path:str)->str:
+    '''the directory of path, made if needed (once per process)'''
+    directory=os.path.dirname(path) or '.'
+    if directory not in _made:
+        os.makedirs(directory,exist_ok=True)
+        _made.add(directory)
+    return directory
+
+
+@contextlib.contextmanager
+def atomic_path(path:str):
+    '''a temporary file beside path (its directory made if needed), to write
+    and renamed to path if the block succeeds, removed if it fails'''
+    directory=make_directory(path)
+    #unique across the processes and the threads writing in the same directory
+    tmp=os.path.join(directory,f'.{os.path.basename(path)}.{os.getpid()}.{next(_tmpcount)}.tmp')
+    try:
+        yield tmp
+        os.replace(tmp,path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def write_composition(myjson:dict,outputfile:str,fmt:str='pretty')->None:
+    outfmt=get_format(fmt)
+    with atomic_path(outputfile) as tmp:
+        with outfmt.opener(tmp,outputfile) as out:
+            outfmt.dump(myjson,out)
+
+
+def write_encoded(encoded:bytes,outputfile:str,fmt:str='pretty')->None:
+    '''write the composition already encoded in format fmt'''
+    with atomic_path(outputfile) as tmp:
+        with get_format(fmt).opener(tmp,outputfile) as out:
+            out.write(encoded)
+
+
+def write_streamed(skeleton:dict,placeholder:str,items,outputfile:str,fmt:str='pretty')->int:
+    '''write skeleton in format fmt replacing the placeholder string value with
+    the list of the items yielded by items (or their bytes, already encoded in
+    fmt), serialized one at a time.
+    The output is the same as write_composition of the whole document.
+    Returns the number of items written'''
+    outfmt=get_format(fmt)
+    text=outfmt.encode(skeleton)
+    marker=outfmt.encode(placeholder)
+    cut=text.index(marker)
+    head,tail=text[:cut],text[cut+len(marker):]
+    if outfmt.indent:
+        #indentation of the line holding the placeholder
+        line=head[head.rfind(b'\n')+1:]
+        depth=len(line)-len(line.lstrip(b' '))
+        pad=b'\n'+b' '*(depth+outfmt.indent)
+        close=b'\n'+b' '*depth+b']'
+    else:
+        pad=b''
+        close=b']'
+    n=0
+    with atomic_path(outputfile) as tmp:
+        with outfmt.opener(tmp,outputfile) as out:
+            out.write(head)
+            for item in items:
+                encoded=item if isinstance(item,bytes) else outfmt.encode(item)
+                if outfmt.indent:
+                    encoded=encoded.replace(b'\n',pad)
+                out.write((b',' if n else b'[')+pad+encoded)
+                n+=1
+            out.write(close if n else b'[]')
+            out.write(tail)
+    return n
+
+
+def read_composition(path:str)->dict:
+    '''load a composition written in any of the formats'''
+    if path.endswith('.gz'):
+        with gzip.open(path,'rb') as f:
+            return json.load(f)
+    if path.endswith('.zst'):
+        with open(path,'rb') as f:
+            return json.load(zstandard.ZstdDecompressor().stream_reader(f))
+    with open(path,'rb') as f:
+        return json.load(f)
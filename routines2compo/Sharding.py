@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+'''deterministic partition of a batch between independent processes or nodes.
+With --shard i/N a run converts only the phenopackets whose path, relative to
+the input root it was found under, hashes to its slice: every node walks the
+same roots and keeps its own files, with no coordination, whatever the order
+of the walk and wherever the roots are mounted.
+A shard writes its log, manifest, dead letter and verify report aside
+(<file>.shard-i-of-N); merge_shards puts them back together as the files of
+a single run'''
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from routines2compo.Manifest import VERSION, save_manifest
+from routines2compo.VerifyCompositions import write_verify_report
+
+
+def parse_shard(spec:str)->tuple:
+    '''(i,N) of the shard spec "i/N", 1<=i<=N'''
+    try:
+        index,count=(int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f'--shard must be i/N, e.g. 1/4 (got {spec!r})') from None
+    if count<1 or not 1<=index<=count:
+        raise ValueError(f'--shard {spec}: the shard must be between 1 and N (N>=1)')
+    return index,count
+
+
+def shard_of(filename:str,root:str,count:int)->int:
+    '''the shard (1..count) of filename found under root'''
+    relative=os.path.relpath(filename,os.path.abspath(root)).replace(os.sep,'/')
+    h=hashlib.sha1(relative.encode('utf-8','surrogateescape')).digest()
+    return int.from_bytes(h[:8],'big')%count+1
+
+
+def shard_path(path:str,index:int,count:int)->str:
+    '''the file of shard index of count written in place of path'''
+    return f'{path}.shard-{index}-of-{count}'
+
+
+def merge_shards(count:int,logfile:str,manifest:str,deadletter:str,verifyreport:str)->dict:
+    '''merge the files written by the count shards into logfile, manifest,
+    deadletter and verifyreport: {kind:[missing shards]} for each kind of file
+    at least one shard wrote'''
+    missing={}
+    for kind,path,merge in (('log',logfile,_merge_logs),('manifest',manifest,_merge_manifests),
+            ('dead letter',deadletter,_merge_dead_letters),('verify report',verifyreport,_merge_verify_reports)):
+        parts={index:shard_path(path,index,count) for index in range(1,count+1)}
+        found={index:part for index,part in parts.items() if os.path.exists(part)}
+        if not found:
+            continue
+        missing[kind]=[index for index in parts if index not in found]
+        merge(found,count,path)
+        logging.info(f'{len(found)} of {count} shard {kind} files merged into {path}')
+    return missing
+
+
+def _merge_logs(parts:dict,count:int,path:str)->None:
+    with open(path,'w') as out:
+        for index,part in parts.items():
+            out.write(f'=== shard {index}/{count}: {part}\n')
+            out.flush()
+            with open(part,'r') as f:
+                shutil.copyfileobj(f,out)
+
+
+def _merge_manifests(parts:dict,count:int,path:str)->None:
+    merged=None
+    for index,part in parts.items():
+        with open(part,'r') as f:
+            manifest=json.load(f)
+        if manifest.get('version')!=VERSION:
+            raise ValueError(f'{part}: manifest version {manifest.get("version")}, expected {VERSION}')
+        if merged is None:
+            merged={'version':VERSION,'settings':manifest['settings'],'files':{}}
+        elif manifest['settings']!=merged['settings']:
+            raise ValueError(f'{part}: made with settings {manifest["settings"]}, the other shards with {merged["settings"]}')
+        merged['files'].update(manifest['files'])
+    save_manifest(merged,path)
+
+
+def _merge_dead_letters(parts:dict,count:int,path:str)->None:
+    with open(path,'w') as out:
+        for part in parts.values():
+            with open(part,'r') as f:
+                for line in f:
+                    if line.strip():
+                        out.write(line if line.endswith('\n') else line+'\n')
+
+
+def _merge_verify_reports(parts:dict,count:int,path:str)->None:
+    entries=[]
+    seconds=0.0
+    for part in parts.values():
+        with open(part,'r') as f:
+            report=json.load(f)
+        entries.extend(report['files'])
+        #the shards ran side by side
+        seconds=max(seconds,report['totals']['seconds'])
+    write_verify_report(entries,path,seconds)
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+'''locate and load the .ctxinfo/.context sidecar files of the phenopackets.
+Sidecars are cached by content: files that are hard links or copies of each
+other are parsed only once per run and every conversion gets its own copy of
+the cached template. A file whose size, mtime and inode did not change is not
+even read again.
+Besides the per-phenopacket sidecar (same name as the phenopacket, extension
+.ctxinfo/.context) a directory can hold one shared.ctxinfo/shared.context used
+by all the phenopackets in it that have no sidecar of their own.
+The cache can be used from several threads'''
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+SHARED='shared'
+#max number of distinct sidecar contents kept in memory
+CACHE_SIZE=256
+
+_bycontent=OrderedDict()
+_bystat=OrderedDict()
+stats={'hits':0,'reads':0,'parses':0}
+_lock=threading.Lock()
+
+
+def find_sidecar(filename:str,ext:str)->str:
+    '''path of the ext sidecar of the phenopacket filename or None if there is none'''
+    own=filename[:-4]+ext
+    if os.path.isfile(own):
+        return own
+    shared=os.path.join(os.path.dirname(filename),SHARED+'.'+ext)
+    if os.path.isfile(shared):
+        logging.debug(f'using shared {ext} {shared} for {filename}')
+        return shared
+    return None
+
+
+def load_sidecar(path:str)->json:
+    '''parsed content of the sidecar path (a private copy of the cached template)'''
+    st=os.stat(path)
+    statkey=(st.st_dev,st.st_ino,st.st_size,st.st_mtime_ns)
+    with _lock:
+        digest=_bystat.get(statkey)
+        if digest is not None and digest in _bycontent:
+            stats['hits']+=1
+            _bystat.move_to_end(statkey)
+            _bycontent.move_to_end(digest)
+            cached=_bycontent[digest]
+        else:
+            cached=None
+    if cached is not None:
+        return _copy(cached)
+    #the file is read and parsed outside of the lock
+    with open(path,'rb') as f:
+        raw=f.read()
+    digest=hashlib.sha1(raw).digest()
+    with _lock:
+        stats['reads']+=1
+        _remember(_bystat,statkey,digest)
+        cached=_bycontent.get(digest)
+        if cached is not None:
+            _bycontent.move_to_end(digest)
+    if cached is None:
+        cached=json.loads(raw)
+        with _lock:
+            stats['parses']+=1
+            _remember(_bycontent,digest,cached)
+    return _copy(cached)
+
+
+def clear_cache()->None:
+    with _lock:
+        _bycontent.clear()
+        _bystat.clear()
+
+
+def _remember(cache:OrderedDict,key,value)->None:
+    cache[key]=value
+    cache.move_to_end(key)
+    while len(cache)>CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _copy(obj):
+    #much cheaper than copy.deepcopy for plain json trees
+    if isinstance(obj,dict):
+        return {k:_copy(v) for k,v in obj.items()}
+    if isinstance(obj,list):
+        return [_copy(v) for v in obj]
+    return obj
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+'''incremental reading of big json documents.
+Only the top level object is walked by hand: every value is decoded with the
+C decoder as soon as it is complete in the buffer, so the memory needed is
+bounded by the biggest single value (e.g. one cohort member) and not by the
+size of the file.
+The phenopacket files are decoded rejecting the objects that repeat a key, as
+the protobuf json parser (json_format.Parse) does: json.load would silently
+keep the last value'''
+import json
+import logging
+
+CHUNK=1<<20
+
+_WS=' \t\n\r'
+
+
+def unique_keys(pairs:list)->dict:
+    '''object_pairs_hook refusing an object that repeats a key'''
+    obj=dict(pairs)
+    if len(obj)!=len(pairs):
+        seen=set()
+        for key,_ in pairs:
+            if key in seen:
+                raise ValueError(f'Name "{key}" duplicated')
+            seen.add(key)
+    return obj
+
+
+def loads(text):
+    '''json.loads of text (str or bytes) refusing the duplicate keys'''
+    return json.loads(text,object_pairs_hook=unique_keys)
+
+
+_decoder=json.JSONDecoder(object_pairs_hook=unique_keys)
+
+
+class JsonStreamReader:
+    '''minimal pull parser over the top level object of a json file'''
+    def __init__(self,f,chunk:int=CHUNK):
+        self.f=f
+        self.chunk=chunk
+        self.buf=''
+        self.pos=0
+        self.eof=False
+
+    def _fill(self)->bool:
+        if self.eof:
+            return False
+        #read at least as much as is pending so that a value bigger than
+        #the chunk is not decoded over and over again
+        data=self.f.read(max(self.chunk,len(self.buf)-self.pos))
+        if not data:
+            self.eof=True
+            return False
+        #drop what has already been consumed before growing the buffer
+        self.buf=self.buf[self.pos:]+data
+        self.pos=0
+        return True
+
+    def _skipws(self)->None:
+        while True:
+            while self.pos<len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos+=1
+            if self.pos<len(self.buf) or not self._fill():
+                return
+
+    def peek(self)->str:
+        self._skipws()
+        if self.pos>=len(self.buf):
+            raise ValueError('unexpected end of json document')
+        return self.buf[self.pos]
+
+    def expect(self,char:str)->None:
+        if self.peek()!=char:
+            raise ValueError(f'expected {char!r} at offset {self.pos}, found {self.buf[self.pos]!r}')
+        self.pos+=1
+
+    def value(self):
+        '''decode the next complete json value'''
+        self._skipws()
+        while True:
+            try:
+                obj,end=_decoder.raw_decode(self.buf,self.pos)
+                #a number or literal touching the end of the buffer may be truncated
+                if end<len(self.buf) or self.eof:
+                    self.pos=end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def items(self):
+        '''iterate over the keys of the top level object; the caller must
+        consume each value with value() or array() before asking for the next key'''
+        self.expect('{')
+        if self.peek()=='}':
+            self.pos+=1
+            return
+        seen=set()
+        while True:
+            key=self.value()
+            if key in seen:
+                raise ValueError(f'Name "{key}" duplicated')
+            seen.add(key)
+            self.expect(':')
+            yield key
+            sep=self.peek()
+            self.pos+=1
+            if sep=='}':
+                return
+            if sep!=',':
+                raise ValueError(f'expected "," or "}}" after value of {key!r}')
+
+    def array(self):
+        '''iterate over the elements of the array starting at the current position'''
+        self.expect('[')
+        if self.peek()==']':
+            self.pos+=1
+            return
+        while True:
+            yield self.value()
+            sep=self.peek()
+            self.pos+=1
+            if sep==']':
+                return
+            if sep!=',':
+                raise ValueError('expected "," or "]" in array')
+
+
+def read_object_streaming(filename:str,key:str,element)->tuple:
+    '''decode the top level object of filename except for the array under key:
+    its elements are handed to element(index,value) one by one as soon as they
+    are decoded, and are not kept. The file is read once.
+    Returns (the object without key,number of elements or None if key holds no array)'''
+    header={}
+    count=None
+    with open(filename,'r') as f:
+        reader=JsonStreamReader(f)
+        for k in reader.items():
+            if k==key and reader.peek()=='[':
+                count=0
+                for value in reader.array():
+                    element(count,value)
+                    count+=1
+            else:
+                header[k]=reader.value()
+    logging.debug(f'{filename}: {count} elements of {key} streamed')
+    return header,count
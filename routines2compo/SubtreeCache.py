@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+'''the subtrees that recur across the files of a batch (the same proband or
+relatives in several family and interpretation files, the same metaData
+block everywhere) are recognised by the hash of their content, so that
+    -their protobuf validation, by far the slowest step, is done only once
+    -their conversion is done only once when the converted subtrees can be
+     shared (--shared-terms or --compact-nodes): a copy would cost more than
+     converting them again
+The digests computed while validating a document are remembered for its
+subtrees (by identity) until forget_digests(), so that the conversion of the
+same document finds them without hashing again.
+Both caches are bounded, the least recently used entries are evicted'''
+import hashlib
+import json
+from collections import OrderedDict
+
+#distinct (message,subtree) validated kept
+VALIDATED_SIZE=16384
+#distinct converted subtrees kept: they can be big
+CONVERTED_SIZE=256
+
+_validated=OrderedDict()
+_converted=OrderedDict()
+#id(subtree)->(subtree,digest): the subtree is held so that its id is not reused
+_digests={}
+stats={'validations':0,'validations_skipped':0,'conversions':0,'conversions_skipped':0}
+
+
+#the decoded json is a tree: no need to check for cycles
+_canonical=json.JSONEncoder(sort_keys=True,separators=(',',':'),ensure_ascii=False,check_circular=False)
+
+def digest(obj)->bytes:
+    '''hash of the content of the decoded json obj, whatever its key order'''
+    return hashlib.sha1(_canonical.encode(obj).encode('utf-8','surrogatepass')).digest()
+
+
+def remember_digest(obj)->bytes:
+    '''digest of obj, remembered until forget_digests()'''
+    found=_digests.get(id(obj))
+    if found is not None:
+        return found[1]
+    d=digest(obj)
+    _digests[id(obj)]=(obj,d)
+    return d
+
+
+def digest_of(obj)->bytes:
+    '''the remembered digest of obj, None if it has none'''
+    found=_digests.get(id(obj))
+    return found[1] if found is not None else None
+
+
+def forget_digests()->None:
+    _digests.clear()
+
+
+def is_validated(name:str,d:bytes)->bool:
+    key=(name,d)
+    if key in _validated:
+        _validated.move_to_end(key)
+        stats['validations_skipped']+=1
+        return True
+    return False
+
+
+def validated(name:str,d:bytes)->None:
+    stats['validations']+=1
+    _remember(_validated,(name,d),None,VALIDATED_SIZE)
+
+
+def converted(key:tuple):
+    '''the converted subtree of key, None if it is not cached'''
+    found=_converted.get(key)
+    if found is not None:
+        _converted.move_to_end(key)
+        stats['conversions_skipped']+=1
+    return found
+
+
+def remember_converted(key:tuple,value)->None:
+    stats['conversions']+=1
+    _remember(_converted,key,value,CONVERTED_SIZE)
+
+
+def clear_converted()->None:
+    '''to call when the shape of the converted subtrees changes (dicts/Nodes)'''
+    _converted.clear()
+
+
+def clear()->None:
+    _validated.clear()
+    _converted.clear()
+    _digests.clear()
+
+
+def _remember(cache:OrderedDict,key,value,size:int)->None:
+    cache[key]=value
+    cache.move_to_end(key)
+    while len(cache)>size:
+        cache.popitem(last=False)
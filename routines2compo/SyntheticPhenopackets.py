@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+'''synthetic phenopackets v1 (Interpretation, Cohort, Family) of tunable size,
+modelled on the samples in Phenopackets/. Used by benchmark_conversion.py.
+All the generators are deterministic for a given seed'''
+import json
+import random
+import uuid
+
+CTXINFO={
+    "ctx/language": "en",
+    "ctx/territory": "SI",
+    "ctx/composer_name": "Silvia Blake",
+    "ctx/id_namespace": "HOSPITAL-NS",
+    "ctx/id_scheme": "HOSPITAL-NS",
+    "ctx/participation_name": "Dr. Marcus Johnson",
+    "ctx/participation_function": "requester",
+    "ctx/participation_mode": "face-to-face communication",
+    "ctx/participation_id": "199",
+    "ctx/health_care_facility|name": "Hospital",
+    "ctx/health_care_facility|id": "9091"
+}
+CONTEXT={"context": [{"report_id": ["Report ID 20"], "status": ["Status 65"]}]}
+
+
+class Generator:
+    '''builds the phenopacket pieces; ontology terms are drawn from a small
+    vocabulary so that, as in real cohorts, they repeat'''
+    def __init__(self,seed:int=0,vocabulary:int=500):
+        self.rnd=random.Random(seed)
+        self.vocabulary=vocabulary
+
+    def uid(self)->str:
+        return str(uuid.UUID(int=self.rnd.getrandbits(128),version=4))
+
+    def term(self)->dict:
+        code=f'{chr(65+self.rnd.randrange(26))}.{self.rnd.randrange(self.vocabulary)}'
+        return {'id':'external_terminology:'+code,'label':code+' description'}
+
+    def text(self,what:str)->str:
+        return f'{what} {self.rnd.randrange(100)}'
+
+    def age(self)->dict:
+        return {'age':f'P{self.rnd.randrange(1,80)}Y{self.rnd.randrange(12)}M'}
+
+    def phenotypic_feature(self)->dict:
+        return {
+            'description':self.text('description'),
+            'type':self.term(),
+            'severity':self.term(),
+            'modifiers':[self.term()],
+            'classOfOnset':self.term(),
+            'evidence':[{'evidenceCode':self.term(),
+                'reference':{'id':self.uid(),'description':self.text('description')}}]
+        }
+
+    def biosample(self)->dict:
+        return {
+            'id':self.uid(),
+            'individualId':self.uid(),
+            'description':self.text('description'),
+            'sampledTissue':self.term(),
+            'taxonomy':self.term(),
+            'ageOfIndividualAtCollection':self.age(),
+            'histologicalDiagnosis':self.term(),
+            'tumorProgression':self.term(),
+            'tumorGrade':self.term(),
+            'diagnosticMarkers':[self.term()],
+            'procedure':{'code':self.term(),'bodySite':self.term()}
+        }
+
+    def variant(self,i:int)->dict:
+        kind=i%4
+        if kind==0:
+            allele={'hgvsAllele':{'id':self.uid(),'hgvs':self.text('hgvs')}}
+        elif kind==1:
+            allele={'vcfAllele':{'genomeAssembly':'GRCh38','id':self.uid(),'chr':f'chr {self.rnd.randrange(1,23)}',
+                'pos':self.rnd.randrange(1,10**8),'ref':'A','alt':'G','info':self.text('info')}}
+        elif kind==2:
+            allele={'spdiAllele':{'id':self.uid(),'seqId':self.uid(),'position':self.rnd.randrange(1,10**8),
+                'deletedSequence':'A','insertedSequence':'G'}}
+        else:
+            allele={'iscnAllele':{'id':self.uid(),'iscn':self.text('iscn')}}
+        allele['zygosity']=self.term()
+        return allele
+
+    def gene(self)->dict:
+        term=self.term()
+        return {'id':term['id'],'symbol':term['label']}
+
+    def disease(self)->dict:
+        return {'term':self.term(),'ageOfOnset':self.age(),'tumorStage':[self.term()]}
+
+    def htsfile(self)->dict:
+        return {'uri':'http://example.com/path/resource','description':self.text('description'),'htsFormat':'VCF',
+            'genomeAssembly':'GRCh38','individualToSampleIdentifiers':{self.uid():self.uid()}}
+
+    def metadata(self,resources:int=2)->dict:
+        return {
+            'created':'2019-10-10T08:43:16.165Z',
+            'createdBy':self.text('created by'),
+            'submittedBy':self.text('submitted by'),
+            'resources':[{'id':self.uid(),'name':self.text('name'),'url':'http://example.com/path/resource',
+                'version':self.text('version'),'namespacePrefix':self.text('namespace_prefix'),
+                'iriPrefix':self.text('iri-prefix')} for _ in range(resources)],
+            'updates':[{'timestamp':'2019-10-10T08:43:16.165Z','updatedBy':self.text('updated_by'),'comment':self.text('comment')}],
+            'phenopacketSchemaVersion':'1.0.0',
+            'externalReferences':[{'id':self.uid(),'description':self.text('description')}]
+        }
+
+    def phenopacket(self,features:int=5,biosamples:int=2,variants:int=4,genes:int=2,diseases:int=1)->dict:
+        return {
+            'id':self.uid(),
+            'subject':{'id':self.uid()},
+            'phenotypicFeatures':[self.phenotypic_feature() for _ in range(features)],
+            'biosamples':[self.biosample() for _ in range(biosamples)],
+            'genes':[self.gene() for _ in range(genes)],
+            'variants':[self.variant(i) for i in range(variants)],
+            'diseases':[self.disease() for _ in range(diseases)],
+            'htsFiles':[self.htsfile()],
+            'metaData':self.metadata()
+        }
+
+    def pedigree(self,persons:int)->dict:
+        familyid=self.uid()
+        return {'persons':[{'familyId':familyid,'individualId':self.uid(),'paternalId':self.uid(),'maternalId':self.uid(),
+            'sex':self.rnd.choice(['FEMALE','MALE','OTHER_SEX']),'affectedStatus':self.rnd.choice(['AFFECTED','UNAFFECTED'])}
+            for _ in range(persons)]}
+
+    def family(self,relatives:int=3,persons:int=4,**sizes)->dict:
+        return {
+            'id':self.uid(),
+            'proband':self.phenopacket(**sizes),
+            'relatives':[self.phenopacket(**sizes) for _ in range(relatives)],
+            'pedigree':self.pedigree(persons),
+            'htsFiles':[self.htsfile()],
+            'metaData':self.metadata()
+        }
+
+    def cohort(self,members:int=10,**sizes)->dict:
+        return {
+            'id':self.uid(),
+            'description':self.text('description'),
+            'members':[self.phenopacket(**sizes) for _ in range(members)],
+            'htsFiles':[self.htsfile()],
+            'metaData':self.metadata()
+        }
+
+    def interpretation(self,family:bool=False,relatives:int=3,persons:int=4,diagnoses:int=1,**sizes)->dict:
+        interpretation={'id':self.uid(),'resolutionStatus':'IN_PROGRESS'}
+        if family:
+            interpretation['family']=self.family(relatives,persons,**sizes)
+        else:
+            interpretation['phenopacket']=self.phenopacket(**sizes)
+        interpretation['diagnosis']=[{'disease':self.disease(),'genomicInterpretations':[
+            {'status':'CAUSATIVE','gene':self.gene()},{'status':'CAUSATIVE','variant':self.variant(i)}]}
+            for i in range(diagnoses)]
+        interpretation['metaData']=self.metadata()
+        return interpretation
+
+
+def write_phenopacket(path:str,phenopacket:dict)->None:
+    '''write phenopacket in path (.json) together with its .ctxinfo/.context sidecars'''
+    with open(path,'w') as f:
+        json.dump(phenopacket,f,indent=2)
+    for ext,content in (('ctxinfo',CTXINFO),('context',CONTEXT)):
+        with open(path[:-4]+ext,'w') as f:
+            json.dump(content,f,indent=4)
@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+'''validation only of a whole corpus (--validate-only): every phenopacket is
+checked against the phenopackets schema while it is read (validate_file), by a
+pool of processes, without converting it. Memory stays bounded by the biggest
+member or sub-message whatever the size of the files, and an invalid file is
+reported with the path of its first invalid element'''
+import logging
+import time
+
+from routines2compo.Convert2Composition import validate_file
+from routines2compo.Instrumentation import set_file
+from routines2compo.OrderedPool import init_logging_worker, ordered_map
+
+
+def validate_one(filename:str)->dict:
+    '''the outcome of the validation of filename'''
+    start=time.perf_counter()
+    set_file(filename)
+    entry={'phenopacket':filename}
+    try:
+        entry['message']=validate_file(filename)
+        entry['status']='valid'
+    except Exception as e:
+        #not json or not a phenopacket (ValidationError) is invalid, unreadable is an error
+        entry['status']='invalid' if isinstance(e,ValueError) else 'error'
+        entry['error']=f'{type(e).__name__}: {e}'
+        entry['path']=getattr(e,'path',None)
+    entry['seconds']=time.perf_counter()-start
+    return entry
+
+
+def validate_files(filenames,workers:int,loglevel:int=logging.WARNING,logfile:str=None):
+    '''yield the outcome of each file, in order'''
+    for _,entry in ordered_map(validate_one,((filename,) for filename in filenames),workers,
+            initializer=init_logging_worker,initargs=(loglevel,logfile),failed=_died):
+        yield entry
+
+
+def _died(args:tuple,e:Exception)->dict:
+    return {'phenopacket':args[0],'status':'error','error':f'{type(e).__name__}: {e}','path':None,'seconds':0.0}
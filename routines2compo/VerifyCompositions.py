@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+'''regression check of a whole corpus: every phenopacket having a .target is
+compared with its target by a pool of processes. A composition on disk is
+reused only if the manifest records it as the conversion of this phenopacket,
+by this release of the converter, and nothing changed since; otherwise it is
+converted first (and recorded in the manifest). Only the --incremental and
+--verify runs record their compositions in the manifest: after a plain
+conversion run nothing is reused, the compositions are not hashed on every
+run for the sake of a later verify. The outcome of all the files goes in a
+single json report'''
+import collections
+import json
+import logging
+import time
+
+from routines2compo.CheckComposition import check_composition, format_path
+from routines2compo.CompactComposition import plain
+from routines2compo.Convert2Composition import convert2composition
+from routines2compo.FindPhenopackets import PhenopacketFiles, phenopacket_files
+from routines2compo.Manifest import entry_is_current, manifest_entry
+from routines2compo.OrderedPool import init_logging_worker, ordered_map
+from routines2compo.OutputWriters import read_composition
+
+VERIFY_REPORT='./phenopacket_2_compositions_structured.verify.json'
+
+
+def verify_one(filename:str,outputfile:str,options:dict,previous:dict=None,files:PhenopacketFiles=None)->dict:
+    '''compare the composition of filename with its .target: the report entry of filename.
+    previous=manifest entry of filename; a new one is put under 'manifest' if converted.
+    files=the sidecars and target paired with filename (looked up if not given)'''
+    start=time.perf_counter()
+    files=files or phenopacket_files(filename)
+    targetfile=files.target or filename[:-4]+'target'
+    entry={'phenopacket':filename,'target':targetfile,'composition':outputfile}
+    try:
+        entry['reused']=entry_is_current(previous,filename,outputfile,files)
+        if entry['reused']:
+            composition=read_composition(outputfile)
+        else:
+            composition=convert2composition(filename,outputfile,options['stream'],options['outputformat'],files)
+            entry['manifest']=manifest_entry(filename,outputfile,previous,files)
+            if composition is None:
+                #streamed cohort
+                composition=read_composition(outputfile)
+        result=check_composition(plain(composition),targetfile,options['max_differences'])
+    except Exception as e:
+        entry.update(status='error',error=f'{type(e).__name__}: {e}')
+    else:
+        entry.update(status='pass' if not result.mismatched else 'fail',matched=result.matched,
+            mismatched=result.mismatched,complete=result.complete,
+            differences=[{'path':format_path(path),'obtained':one,'target':two} for path,one,two in result.differences])
+    entry['seconds']=time.perf_counter()-start
+    return entry
+
+
+def verify(jobs,workers:int,options:dict,loglevel:int=logging.WARNING,logfile:str=None,manifest:dict=None):
+    '''yield the report entry of each (filename,outputfile,PhenopacketFiles) job
+    having a .target, in the order of the jobs. manifest: the compositions that can be reused'''
+    entries=manifest['files'] if manifest is not None else {}
+    jobs=((filename,outputfile,options,entries.get(filename),files) for filename,outputfile,files in jobs
+        if files.target is not None)
+    for _,entry in ordered_map(verify_one,jobs,workers,initializer=init_logging_worker,
+            initargs=(loglevel,logfile),failed=_died):
+        yield entry
+
+
+def _died(args:tuple,e:Exception)->dict:
+    filename,outputfile,_,_,files=args
+    return {'phenopacket':filename,'target':files.target,'composition':outputfile,
+        'status':'error','error':f'{type(e).__name__}: {e}','seconds':0.0}
+
+
+def write_verify_report(entries:list,path:str,seconds:float)->dict:
+    '''write the aggregated report of the entries in path and return its totals'''
+    totals=collections.Counter(entry['status'] for entry in entries)
+    totals={'files':len(entries),'pass':totals['pass'],'fail':totals['fail'],'error':totals['error'],
+        'reused':sum(1 for entry in entries if entry.get('reused')),'seconds':seconds}
+    with open(path,'w') as f:
+        json.dump({'totals':totals,'files':entries},f,indent=4)
+    return totals
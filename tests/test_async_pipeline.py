@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+'''AsyncPipeline.run_pipeline: a worker that dies only fails its own file, the
+events of a failed conversion are kept and the writes are attributed to their file'''
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from routines2compo import AsyncPipeline, Instrumentation
+from routines2compo.FindPhenopackets import PhenopacketFiles
+
+DIES=3
+FAILS=5
+
+
+def fake_convert2report(jsonp:dict,filename:str,ctxinfo:dict,context:dict,ff:bool)->dict:
+    with Instrumentation.stage('fake_convert'):
+        if jsonp['i']==DIES:
+            os._exit(1)
+        if jsonp['i']==FAILS:
+            raise ValueError('not a phenopacket')
+    return {'i':[jsonp['i']]}
+
+
+@unittest.skipUnless(multiprocessing.get_start_method()=='fork','the workers must inherit the patched converter')
+class RunPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        root=self.dir.name
+        for ext in ('ctxinfo','context'):
+            with open(os.path.join(root,'shared.'+ext),'w') as f:
+                f.write('{}')
+        self.jobs=[]
+        for i in range(12):
+            name=f'p{i}.json'
+            with open(os.path.join(root,name),'w') as f:
+                json.dump({'i':i},f)
+            files=PhenopacketFiles(root,name,os.path.join(root,'shared.ctxinfo'),os.path.join(root,'shared.context'),None)
+            self.jobs.append((os.path.join(root,name),os.path.join(root,'out',f'C{i}.json'),files))
+        Instrumentation.reset()
+        Instrumentation.enable()
+
+    def tearDown(self):
+        Instrumentation.enabled=False
+        Instrumentation.reset()
+        self.dir.cleanup()
+
+    def test_failures_stay_with_their_file(self):
+        options={'outputformat':'compact','keepjson':False,'incremental':False}
+        with mock.patch.object(AsyncPipeline,'convert2report',fake_convert2report):
+            results=list(AsyncPipeline.run_pipeline(iter(self.jobs),2,options))
+        self.assertEqual([job for job,_ in results],self.jobs)
+        for i,((filename,outputfile,_),(composition,error,entry,events)) in enumerate(results):
+            with self.subTest(i=i):
+                if i==DIES:
+                    self.assertTrue(error.startswith('BrokenProcessPool'))
+                elif i==FAILS:
+                    self.assertEqual(error,'ValueError: not a phenopacket')
+                    #the events of the failed conversion come back
+                    self.assertIn('fake_convert',{event['stage'] for event in events[0] if event['file']==filename})
+                else:
+                    self.assertIsNone(error)
+                    with open(outputfile) as f:
+                        self.assertEqual(json.load(f),{'i':[i]})
+        #the writes ran in io threads, they are attributed to their file
+        files=Instrumentation.summary()['files']
+        written=[filename for filename,_,_ in self.jobs if 'write' in files.get(filename,{})]
+        self.assertEqual(written,[filename for i,(filename,_,_) in enumerate(self.jobs) if i not in (DIES,FAILS)])
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+'''BulkNdjson.convert_ndjson: one line per record in order, the failed records
+in the dead letter file as records, the workers set up by the initializer'''
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from routines2compo import BulkNdjson
+from routines2compo.DeadLetter import DeadLetterFile, load_dead_letters
+
+_configured=None
+
+
+def configure(value:str)->None:
+    global _configured
+    _configured=value
+
+
+def fake_convert_record(line:str,where:str,basedir:str,ff:bool=True)->dict:
+    record=json.loads(line)
+    if record['i']==2:
+        raise ValueError('bad record')
+    return {'i':record['i'],'configured':_configured}
+
+
+@unittest.skipUnless(multiprocessing.get_start_method()=='fork','the workers must inherit the patched converter')
+class ConvertNdjsonTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        self.input=os.path.join(self.dir.name,'records.ndjson')
+        with open(self.input,'w') as f:
+            for i in range(6):
+                f.write(json.dumps({'i':i})+'\n')
+                if i==3:
+                    f.write('\n')
+        self.output=os.path.join(self.dir.name,'out','compositions.ndjson')
+        self.deadletter=os.path.join(self.dir.name,'failed.ndjson')
+
+    def tearDown(self):
+        configure(None)
+        self.dir.cleanup()
+
+    def test_records_in_order(self):
+        for workers in (1,2):
+            with self.subTest(workers=workers):
+                if workers==1:
+                    configure('main')
+                with mock.patch.object(BulkNdjson,'convert_record',fake_convert_record), DeadLetterFile(self.deadletter) as deadletter:
+                    counts=BulkNdjson.convert_ndjson(self.input,self.output,'pretty',workers,deadletter,
+                        initializer=configure,initargs=('worker',))
+                self.assertEqual(counts,(5,1))
+                with open(self.output) as f:
+                    lines=[json.loads(line) for line in f]
+                configured='main' if workers==1 else 'worker'
+                self.assertEqual(lines[:2],[{'i':0,'configured':configured},{'i':1,'configured':configured}])
+                self.assertEqual(lines[2],{'error':'ValueError: bad record','record':f'{self.input}:3'})
+                self.assertEqual([line['i'] for line in lines[3:]],[3,4,5])
+                entries=load_dead_letters(self.deadletter)
+                self.assertEqual([(entry['record'],entry['output']) for entry in entries],[(f'{self.input}:3',self.output)])
+                self.assertNotIn('phenopacket',entries[0])
+
+
+if __name__=='__main__':
+    unittest.main()
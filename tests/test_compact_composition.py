@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+'''the encoder of CompactComposition must write the Nodes byte for byte as
+json.dumps(sort_keys=True) writes the same dicts, indented (pretty) or not (compact)'''
+import io
+import json
+import unittest
+
+from routines2compo import CompactComposition
+from routines2compo.CompactComposition import node, rows, plain, encode, dump
+from routines2compo.OutputWriters import get_format
+
+COMPOSITION={
+    'interpretation_report':[{
+        'ctx':{'language':'en','territory':'IT','composer_name':'Zoë'},
+        'interpretation':[{
+            'id':[{'|id':'PMID:30808312','|issuer':'phenopackets','|assigner':'phenopackets','|type':'id'}],
+            'resolution_status':[{'|value':'SOLVED','|code':'at0007','|ordinal':0}],
+            'phenopacket':[{
+                'phenotypic_feature':[
+                    {'type':[{'|code':'0001250','|terminology':'HP','|value':'Seizure'}],'negated':[False]},
+                    {'type':[{'|code':'0001263','|terminology':'HP','|value':'Global "delay"\n'}],'negated':[True],
+                     'modifier':[]},
+                ],
+                'subject':['patient 1'],
+                'pos':[12345678],
+                'score':[0.25,-1.5e-07,3.0],
+                'empty':{},
+                'none':None,
+                'nested':[[1,[2,[]]],{'b':1,'a':{'|z':'é中','|a':'tab\there'}}],
+            }],
+        }],
+    }],
+}
+
+
+class EncoderTest(unittest.TestCase):
+    def test_pretty_matches_json_dumps(self):
+        self.assertEqual(encode(node(COMPOSITION),4),json.dumps(COMPOSITION,sort_keys=True,indent=4))
+
+    def test_compact_matches_json_dumps(self):
+        self.assertEqual(encode(node(COMPOSITION)),json.dumps(COMPOSITION,sort_keys=True,separators=(',',':')))
+
+    def test_plain_dicts_and_scalars(self):
+        for obj in (COMPOSITION,{},[],[{}],'x',0,None,[[]],{'a':[]}):
+            with self.subTest(obj=obj):
+                self.assertEqual(encode(obj,4),json.dumps(obj,sort_keys=True,indent=4))
+                self.assertEqual(encode(obj),json.dumps(obj,sort_keys=True,separators=(',',':')))
+
+    def test_plain_expands_back(self):
+        self.assertEqual(plain(node(COMPOSITION)),COMPOSITION)
+
+    def test_dump_in_chunks(self):
+        chunk=CompactComposition.CHUNK
+        CompactComposition.CHUNK=3
+        try:
+            out=io.BytesIO()
+            dump(node(COMPOSITION),out,4)
+        finally:
+            CompactComposition.CHUNK=chunk
+        self.assertEqual(out.getvalue().decode(),json.dumps(COMPOSITION,sort_keys=True,indent=4))
+
+    def test_rows_as_nodes_of_the_dicts(self):
+        persons=[{'individual_id':[i],'sex':[{'|value':'FEMALE' if i%2 else 'MALE'}],'family_id':['F1']} for i in range(3)]
+        columns=[[p['individual_id'][0] for p in persons],[node(p['sex'][0]) for p in persons],['F1']*3]
+        table=rows(('individual_id','sex','family_id'),columns)
+        self.assertEqual(table,[node(p) for p in persons])
+        self.assertEqual(encode(table,4),json.dumps(persons,sort_keys=True,indent=4))
+
+    def test_output_formats(self):
+        for name in ('pretty','compact'):
+            with self.subTest(format=name):
+                outfmt=get_format(name)
+                self.assertEqual(outfmt.encode(node(COMPOSITION)),outfmt.encode(COMPOSITION))
+                out=io.BytesIO()
+                outfmt.dump(node(COMPOSITION),out)
+                self.assertEqual(out.getvalue(),outfmt.encode(COMPOSITION))
+
+
+if __name__=='__main__':
+    unittest.main()
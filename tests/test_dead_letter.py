@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+'''the dead letter file of a batch and --retry-failed converting only the
+phenopackets listed there'''
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from routines2compo.DeadLetter import DeadLetterFile, load_dead_letters
+
+PACKAGE=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE=os.path.join(PACKAGE,'Phenopackets','PHENO_FROMinterpretation_report_structured_composition_phenopacket')
+
+try:
+    #the generated schema imports protobuf
+    importlib.import_module('phenopackets_pb2')
+    SCHEMA=True
+except ImportError:
+    SCHEMA=False
+
+
+class DeadLetterFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        self.path=os.path.join(self.dir.name,'failed.ndjson')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_entries(self):
+        with DeadLetterFile(self.path) as deadletter:
+            deadletter.add('a.json','COMPOSITION_FROMa.json','ValueError: bad')
+            deadletter.add_record('records.ndjson:3','out.ndjson','KeyError: id')
+            #written as soon as the failure happens
+            self.assertEqual(len(load_dead_letters(self.path)),2)
+        entries=load_dead_letters(self.path)
+        self.assertEqual({key:entries[0][key] for key in ('phenopacket','composition','error')},
+            {'phenopacket':'a.json','composition':'COMPOSITION_FROMa.json','error':'ValueError: bad'})
+        self.assertEqual(entries[1]['record'],'records.ndjson:3')
+        self.assertNotIn('phenopacket',entries[1])
+
+    def test_load(self):
+        self.assertEqual(load_dead_letters(self.path),[])
+        with open(self.path,'w') as f:
+            f.write('{"phenopacket":"a.json"}\n\n{"phenopacket":"b.js')
+        #the line cut by an interrupted run is skipped
+        self.assertEqual(load_dead_letters(self.path),[{'phenopacket':'a.json'}])
+
+    def test_pending_entries_kept(self):
+        retrying=[{'phenopacket':f'{name}.json','composition':'c','error':'old','time':'t'} for name in 'abc']
+        with DeadLetterFile(self.path,pending=retrying) as deadletter:
+            deadletter.done('a.json')
+            deadletter.add('b.json','c','new')
+            self.assertEqual(deadletter.count,1)
+        #c was not reached before the end of the retry: still listed
+        self.assertEqual([(entry['phenopacket'],entry['error']) for entry in load_dead_letters(self.path)],
+            [('b.json','new'),('c.json','old')])
+
+
+class RetryFailedTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        self.root=os.path.join(self.dir.name,'Phenopackets')
+        os.makedirs(self.root)
+        for name in ('good','late'):
+            for ext in ('.json','.ctxinfo','.context'):
+                shutil.copy(SAMPLE+ext,os.path.join(self.root,name+ext))
+        #late is not complete yet
+        with open(os.path.join(self.root,'late.json'),'w') as f:
+            f.write('{"id":')
+        with open(os.path.join(self.dir.name,'input.txt'),'w') as f:
+            f.write(self.root+'\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_main(self,*args:str)->subprocess.CompletedProcess:
+        env=dict(os.environ,PYTHONPATH=os.pathsep.join(filter(None,[PACKAGE,os.environ.get('PYTHONPATH')])))
+        return subprocess.run([sys.executable,os.path.join(PACKAGE,'phenopacket_2_compositions_structured.py'),
+            '--pathfile','input.txt','--dead-letter','failed.ndjson',*args],
+            cwd=self.dir.name,env=env,capture_output=True,text=True)
+
+    def deadletter(self)->list:
+        return load_dead_letters(os.path.join(self.dir.name,'failed.ndjson'))
+
+    @unittest.skipUnless(SCHEMA,'the conversion validates against the phenopackets schema (protobuf)')
+    def test_retry_converts_only_the_failed(self):
+        first=self.run_main()
+        self.assertEqual(first.returncode,1,first.stdout)
+        self.assertEqual([entry['phenopacket'] for entry in self.deadletter()],[os.path.join(self.root,'late.json')])
+        shutil.copy(SAMPLE+'.json',os.path.join(self.root,'late.json'))
+        retry=self.run_main('--retry-failed')
+        self.assertEqual(retry.returncode,0,retry.stdout)
+        self.assertIn('retrying the 1 phenopackets',retry.stdout)
+        self.assertNotIn('good.json',retry.stdout)
+        self.assertEqual(self.deadletter(),[])
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name,'COMPOSITION_FROMlate.json')))
+
+    def test_retry_skips_the_ndjson_records(self):
+        with open(os.path.join(self.dir.name,'failed.ndjson'),'w') as f:
+            f.write(json.dumps({'phenopacket':os.path.join(self.root,'late.json'),'composition':'./COMPOSITION_FROMlate.json',
+                'error':'old','time':'t'})+'\n')
+            f.write(json.dumps({'record':'records.ndjson:3','output':'out.ndjson','error':'old','time':'t'})+'\n')
+        retry=self.run_main('--retry-failed')
+        #still not complete: listed again, the record is not retried
+        self.assertEqual(retry.returncode,1,retry.stdout)
+        self.assertIn('retrying the 1 phenopackets',retry.stdout)
+        self.assertEqual([entry['error'].split(':')[0] for entry in self.deadletter()],['JSONDecodeError'])
+        self.assertFalse(os.path.exists(os.path.join(self.dir.name,'COMPOSITION_FROMgood.json')))
+
+
+if __name__=='__main__':
+    unittest.main()
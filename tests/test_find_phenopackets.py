@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+'''the input roots: duplicated or nested paths are walked once, through the
+outermost one, and every phenopacket is found once'''
+import os
+import tempfile
+import unittest
+
+from routines2compo.FindPhenopackets import input_roots, iter_phenopackets
+
+
+class InputRootsTest(unittest.TestCase):
+    def test_input_roots(self):
+        cwd=os.getcwd()
+        self.assertEqual(input_roots(['/a/b','/a','/a/','/c','/a/bc',cwd,'.']),['/a','/c',cwd])
+        self.assertEqual(input_roots(['/','/a']),['/'])
+        self.assertEqual(input_roots(['x','y','x/z']),['x','y'])
+
+    def test_found_once(self):
+        with tempfile.TemporaryDirectory() as root:
+            for sub in ('','a','a/b'):
+                os.makedirs(os.path.join(root,sub),exist_ok=True)
+                for ext in ('json','ctxinfo','context'):
+                    with open(os.path.join(root,sub,'p.'+ext),'w') as f:
+                        f.write('{}')
+            paths=[os.path.join(root,'a'),root,os.path.join(root,'a','b'),root+'/']
+            found=[found.root+'/'+found.file for path in input_roots(paths) for found in iter_phenopackets(path)]
+            self.assertEqual(sorted(found),[root+'/a/b/p.json',root+'/a/p.json',root+'/p.json'])
+
+
+if __name__=='__main__':
+    unittest.main()
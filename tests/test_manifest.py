@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+'''Manifest: what an --incremental run considers unchanged since the previous
+run, and the manifest kept only for the same settings'''
+import importlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from routines2compo.FindPhenopackets import phenopacket_files
+from routines2compo.Manifest import is_current, load_manifest, manifest_entry, manifest_settings, save_manifest
+
+PACKAGE=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE=os.path.join(PACKAGE,'Phenopackets','PHENO_FROMinterpretation_report_structured_composition_phenopacket')
+
+try:
+    #the generated schema imports protobuf
+    importlib.import_module('phenopackets_pb2')
+    SCHEMA=True
+except ImportError:
+    SCHEMA=False
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        self.convert()
+
+    def convert(self)->None:
+        #the files of a phenopacket just converted, recorded in the manifest
+        if os.path.exists(self.path('p.context')):
+            os.remove(self.path('p.context'))
+        self.phenopacket=self.path('p.json','{"id":"p"}')
+        self.path('p.ctxinfo','{}')
+        self.path('shared.context','{}')
+        self.composition=self.path('COMPOSITION_FROMp.json','{"report":1}')
+        self.manifest={'files':{self.phenopacket:manifest_entry(self.phenopacket,self.composition)}}
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self,name:str,content:str=None)->str:
+        path=os.path.join(self.dir.name,name)
+        if content is not None:
+            with open(path,'w') as f:
+                f.write(content)
+        return path
+
+    def current(self)->bool:
+        return is_current(self.manifest,self.phenopacket,self.composition,phenopacket_files(self.phenopacket))
+
+    def test_entry(self):
+        entry=self.manifest['files'][self.phenopacket]
+        self.assertEqual(sorted(entry['inputs']),['context','ctxinfo','phenopacket'])
+        self.assertEqual(entry['inputs']['context']['path'],self.path('shared.context'))
+        self.assertEqual(entry['output']['path'],self.composition)
+        self.assertTrue(self.current())
+        self.assertFalse(is_current(self.manifest,self.path('q.json'),self.composition))
+        self.assertFalse(is_current(self.manifest,self.phenopacket,self.path('elsewhere.json')))
+
+    def test_touched_but_not_modified(self):
+        st=os.stat(self.phenopacket)
+        os.utime(self.phenopacket,ns=(st.st_atime_ns,st.st_mtime_ns+10**9))
+        self.assertTrue(self.current())
+        #the new mtime is recorded: the file is not hashed again
+        self.assertEqual(self.manifest['files'][self.phenopacket]['inputs']['phenopacket']['mtime_ns'],st.st_mtime_ns+10**9)
+
+    def test_changes(self):
+        changes={
+            'phenopacket':lambda: self.path('p.json','{"id":"q"}'),
+            'sidecar':lambda: self.path('p.ctxinfo','{"a":1}'),
+            'composition':lambda: self.path('COMPOSITION_FROMp.json','{"report":2}'),
+            'own context appears':lambda: self.path('p.context','{}'),
+            'ctxinfo disappears':lambda: os.remove(self.path('p.ctxinfo')),
+        }
+        for change,apply in changes.items():
+            with self.subTest(change=change):
+                self.convert()
+                apply()
+                self.assertFalse(self.current())
+
+    def test_previous_hashes_reused(self):
+        entry=self.manifest['files'][self.phenopacket]
+        entry['inputs']['phenopacket']['sha256']='kept'
+        again=manifest_entry(self.phenopacket,self.composition,entry)
+        self.assertEqual(again['inputs']['phenopacket']['sha256'],'kept')
+        self.path('p.json','{"id":"q"}')
+        self.assertNotEqual(manifest_entry(self.phenopacket,self.composition,entry)['inputs']['phenopacket']['sha256'],'kept')
+
+    def test_load_and_save(self):
+        path=self.path('run.manifest')
+        settings=manifest_settings('pretty')
+        self.assertEqual(load_manifest(path,settings)['files'],{})
+        save_manifest(dict(self.manifest,version=1,settings=settings),path)
+        self.assertEqual(load_manifest(path,settings)['files'],self.manifest['files'])
+        #another output format or another release of the converter: nothing is trusted
+        self.assertEqual(load_manifest(path,manifest_settings('gzip'))['files'],{})
+        self.assertEqual(load_manifest(path,dict(settings,converter='other'))['files'],{})
+        self.path('run.manifest','{"version":1,"settings"')
+        self.assertEqual(load_manifest(path,settings)['files'],{})
+
+
+@unittest.skipUnless(SCHEMA,'the conversion validates against the phenopackets schema (protobuf)')
+class IncrementalRunTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        self.root=os.path.join(self.dir.name,'Phenopackets')
+        os.makedirs(self.root)
+        for name in ('p','q'):
+            for ext in ('.json','.ctxinfo','.context','.target'):
+                shutil.copy(SAMPLE+ext,os.path.join(self.root,name+ext))
+        with open(os.path.join(self.dir.name,'input.txt'),'w') as f:
+            f.write(self.root+'\n')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_main(self,*args:str)->str:
+        env=dict(os.environ,PYTHONPATH=os.pathsep.join(filter(None,[PACKAGE,os.environ.get('PYTHONPATH')])))
+        return subprocess.run([sys.executable,os.path.join(PACKAGE,'phenopacket_2_compositions_structured.py'),
+            '--pathfile','input.txt',*args],cwd=self.dir.name,env=env,capture_output=True,text=True).stdout
+
+    def test_incremental_then_verify(self):
+        self.assertIn('0 phenopackets unchanged since the last run, 2 converted',self.run_main('--incremental'))
+        self.assertIn('2 phenopackets unchanged since the last run, 0 converted',self.run_main('--incremental'))
+        with open(os.path.join(self.root,'q.ctxinfo'),'a') as f:
+            f.write('\n')
+        self.assertIn('1 phenopackets unchanged since the last run, 1 converted',self.run_main('--incremental'))
+        #--verify reuses the compositions recorded by the incremental runs
+        self.assertIn('(2 compositions reused)',self.run_main('--verify'))
+
+
+if __name__=='__main__':
+    unittest.main()
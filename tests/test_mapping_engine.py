@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+'''the records compiled by MappingEngine from their tables of Fields'''
+import unittest
+
+from routines2compo.MappingEngine import field, compile_record, REQUIRED, VALUE, ID, TERM, TERMS, AGE, CODE, \
+    term, coded, one, many, call, single, nonempty, either, first_pair
+
+
+def _namespace()->dict:
+    '''the functions the transforms call, as Convert2Composition provides them'''
+    namespace={
+        'convertId':lambda idf,ff: {'|id':idf,'ff':ff},
+        'convertIdcode':lambda idt,label: {'|code':idt,'|value':label},
+        'convertTerms':lambda terms,ff: [t['id'] for t in terms],
+    }
+    namespace['child']=compile_record('child',[field('name','name',VALUE,REQUIRED)],namespace)
+    return namespace
+
+
+class MappingEngineTest(unittest.TestCase):
+    def test_sources_and_defaults(self):
+        record=compile_record('record',[
+            field('id','id',ID,REQUIRED),
+            field('subject.id','subject',VALUE),
+            field('description','description',VALUE),
+            field('negated','negated',VALUE,[False]),
+            field('','whole',VALUE),
+        ],_namespace())
+        src={'id':'I1','subject':{'id':'S1'}}
+        self.assertEqual(record(src,True),{'id':[{'|id':'I1','ff':True}],'subject':['S1'],'negated':[False],'whole':[src]})
+        self.assertEqual(record.__name__,'record')
+        #the default is not shared between two records
+        first,second=record({'id':'a'},True),record({'id':'b'},True)
+        first['negated'].append(True)
+        self.assertEqual(second['negated'],[False])
+        with self.assertRaises(KeyError):
+            record({'subject':{'id':'S1'}},True)
+        #the first key of a path may be missing, not the others
+        with self.assertRaises(KeyError):
+            record({'id':'I1','subject':{}},True)
+
+    def test_value_transforms(self):
+        record=compile_record('record',[
+            field('type','type',TERM),
+            field('gene','gene',term('symbol')),
+            field('modifiers','modifier',TERMS),
+            field('onset','onset',AGE),
+            field('format','format',CODE),
+            field('status','status',coded('at0007')),
+            field('resolution','resolution',coded('at0005',valuefirst=True)),
+        ],_namespace())
+        src={'type':{'id':'HP:1','label':'one'},'gene':{'id':'G:1','symbol':'BRCA1'},
+            'modifiers':[{'id':'HP:2','label':'two'},{'id':'HP:3','label':'three'}],
+            'onset':{'age':'P3Y'},'format':'VCF','status':'SOLVED','resolution':'UNKNOWN'}
+        self.assertEqual(record(src,True),{
+            'type':[{'|code':'HP:1','|value':'one'}],
+            'gene':[{'|code':'G:1','|value':'BRCA1'}],
+            'modifier':[{'|code':'HP:2','|value':'two'},{'|code':'HP:3','|value':'three'}],
+            'onset':[{'duration_value':['P3Y']}],
+            'format':[{'|code':'VCF'}],
+            'status':[{'|code':'at0007','|ordinal':0,'|value':'SOLVED'}],
+            'resolution':[{'|value':'UNKNOWN','|code':'at0005','|ordinal':0}],
+        })
+        without=record(src,False)
+        self.assertEqual((without['status'],without['resolution']),([{'|value':'SOLVED'}],[{'|value':'UNKNOWN'}]))
+        self.assertEqual(list(without['status'][0]),['|value'])
+
+    def test_records_and_mappers(self):
+        namespace=_namespace()
+        record=compile_record('record',[
+            field('proband','proband',one('child')),
+            field('relatives','relative',many('child')),
+            field('terms','terms',call('convertTerms')),
+            field('term','term',single('convertTerms')),
+            field('meta','meta',nonempty('child')),
+        ],namespace)
+        src={'proband':{'name':'p'},'relatives':[{'name':'r1'},{'name':'r2'}],'terms':[{'id':'a'},{'id':'b'}],
+            'term':{'id':'c'},'meta':{'name':'m'}}
+        self.assertEqual(record(src,True),{'proband':[{'name':['p']}],'relative':[{'name':['r1']},{'name':['r2']}],
+            'terms':['a','b'],'term':['c'],'meta':[{'name':['m']}]})
+        #the mappers are looked up when the record is called
+        namespace['child']=lambda v,ff: {}
+        self.assertEqual(record({'proband':{},'meta':{'name':'m'}},True),{'proband':[{}]})
+
+    def test_merged_transforms(self):
+        record=compile_record('record',[
+            field('',None,either(('phenopacket','child'),('family','child'))),
+            field('individualToSampleIdentifiers',None,first_pair('individual_identifier','sample_identifier')),
+        ],_namespace())
+        self.assertEqual(record({'phenopacket':{'name':'p'},'family':{'name':'f'}},False),{'phenopacket':[{'name':['p']}]})
+        self.assertEqual(record({'family':{'name':'f'}},False),{'family':[{'name':['f']}]})
+        self.assertEqual(record({},False),{})
+        self.assertEqual(record({'individualToSampleIdentifiers':{'I1':'S1','I2':'S2'}},False),
+            {'individual_identifier':[{'|id':'I1','ff':False}],'sample_identifier':[{'|id':'S1','ff':False}]})
+        self.assertEqual(record({'individualToSampleIdentifiers':{}},False),{})
+
+    def test_out_and_finish(self):
+        fields=[field('name','name',VALUE,REQUIRED)]
+        out={'kept':1}
+        self.assertIs(compile_record('record',fields,{})({'name':'n'},True,out),out)
+        self.assertEqual(out,{'kept':1,'name':['n']})
+        record=compile_record('record',fields,{},finish=lambda element: sorted(element.items()))
+        self.assertEqual(record({'name':'n'},True),[('name',['n'])])
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+'''OrderedPool.ordered_map: results in order, and a worker that dies only
+fails its own item, the batch goes on'''
+import os
+import unittest
+
+from routines2compo.OrderedPool import ordered_map
+
+
+def square(x:int)->int:
+    return x*x
+
+def square_or_die(x:int)->int:
+    #the worker process is killed as by the OOM killer
+    if x%7==3:
+        os._exit(1)
+    return x*x
+
+def square_or_raise(x:int)->int:
+    if x==2:
+        raise ValueError('bad item')
+    return x*x
+
+def _failed(args:tuple,e:Exception)->str:
+    return f'failed {type(e).__name__}'
+
+
+class OrderedMapTest(unittest.TestCase):
+    def test_in_order(self):
+        for workers in (1,3):
+            with self.subTest(workers=workers):
+                self.assertEqual(list(ordered_map(square,((x,) for x in range(50)),workers,window=5)),
+                    [((x,),x*x) for x in range(50)])
+
+    def test_worker_death_fails_only_its_item(self):
+        results=list(ordered_map(square_or_die,((x,) for x in range(30)),3,window=6,failed=_failed))
+        self.assertEqual([args for args,_ in results],[(x,) for x in range(30)])
+        for (x,),result in results:
+            with self.subTest(x=x):
+                self.assertEqual(result,'failed BrokenProcessPool' if x%7==3 else x*x)
+
+    def test_item_exception(self):
+        results=dict(ordered_map(square_or_raise,((x,) for x in range(5)),2,failed=_failed))
+        self.assertEqual(results,{(0,):0,(1,):1,(2,):'failed ValueError',(3,):9,(4,):16})
+
+    def test_without_failed_the_error_is_raised(self):
+        with self.assertRaises(ValueError):
+            list(ordered_map(square_or_raise,((x,) for x in range(5)),2))
+
+
+if __name__=='__main__':
+    unittest.main()
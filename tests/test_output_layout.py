@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+'''OutputLayout: where each layout puts a composition, the roots with the same
+name kept apart and the collisions reported'''
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from routines2compo.OutputLayout import OutputLayout
+
+
+class OutputLayoutTest(unittest.TestCase):
+    def test_layouts(self):
+        filename='/data/Phenos/a/b/p.json'
+        roots=['/data/Phenos']
+        self.assertEqual(OutputLayout('flat','out','.gz').path(filename,'/data/Phenos'),'out/COMPOSITION_FROMp.json.gz')
+        self.assertEqual(OutputLayout('mirror','out',roots=roots).path(filename,'/data/Phenos'),'out/Phenos/a/b/COMPOSITION_FROMp.json')
+        hashed=OutputLayout('hashed','out',roots=roots).path(filename,'/data/Phenos')
+        self.assertRegex(hashed,r'^out/[0-9a-f]{2}/[0-9a-f]{2}/COMPOSITION_FROMp\.json$')
+        #wherever the root is mounted
+        self.assertEqual(OutputLayout('hashed','out',roots=['/mnt/Phenos']).path('/mnt/Phenos/a/b/p.json','/mnt/Phenos'),hashed)
+        with self.assertRaises(ValueError):
+            OutputLayout('tree')
+
+    def test_roots_with_the_same_name(self):
+        roots=['/a/Phenos','/b/Phenos/','/c/Other']
+        for layout in ('mirror','hashed'):
+            with self.subTest(layout=layout):
+                paths=OutputLayout(layout,'out',roots=roots)
+                first,second=paths.path('/a/Phenos/p.json','/a/Phenos'),paths.path('/b/Phenos/p.json','/b/Phenos/')
+                self.assertNotEqual(first,second)
+                if layout=='mirror':
+                    self.assertEqual((first,second),('out/Phenos-1/COMPOSITION_FROMp.json','out/Phenos-2/COMPOSITION_FROMp.json'))
+                    self.assertEqual(paths.path('/c/Other/p.json','/c/Other'),'out/Other/COMPOSITION_FROMp.json')
+        #a generated name never takes the one of another root
+        paths=OutputLayout('mirror','out',roots=['/a/Phenos','/b/Phenos','/c/Phenos-2'])
+        self.assertEqual(len({paths.path(root+'/p.json',root) for root in ('/a/Phenos','/b/Phenos','/c/Phenos-2')}),3)
+        #roots that are not in the list: the hash of their path
+        paths=OutputLayout('mirror','out')
+        self.assertNotEqual(paths.path('/a/Phenos/p.json'),paths.path('/b/Phenos/p.json'))
+
+    def test_collisions(self):
+        for layout,reported in (('flat','use --output-layout mirror or hashed'),('mirror',None)):
+            with self.subTest(layout=layout):
+                paths=OutputLayout(layout,'out',roots=['/data/Phenos'])
+                out=io.StringIO()
+                with redirect_stdout(out):
+                    first=paths.path('/data/Phenos/a/p.json','/data/Phenos')
+                    again=paths.path('/data/Phenos/b/p.json','/data/Phenos')
+                self.assertEqual(first==again,reported is not None)
+                if reported:
+                    self.assertIn(reported,out.getvalue())
+                else:
+                    self.assertEqual(out.getvalue(),'')
+                    self.assertIsNone(paths.assigned)
+        #hashed: same name and same 4 hex digits of the hash below the root
+        paths=OutputLayout('hashed','out',roots=['/data/Phenos'])
+        seen={}
+        out=io.StringIO()
+        with redirect_stdout(out):
+            for i in range(100000):
+                filename=f'/data/Phenos/{i}/p.json'
+                outputfile=paths.path(filename,'/data/Phenos')
+                if outputfile in seen:
+                    break
+                seen[outputfile]=filename
+        self.assertIn(f'{filename} is converted into {outputfile}',out.getvalue())
+        self.assertIn('use --output-layout mirror\n',out.getvalue())
+        #not tracked
+        paths=OutputLayout('flat','out',collisions=False)
+        with redirect_stdout(out):
+            self.assertEqual(paths.path('/x/p.json'),paths.path('/y/p.json'))
+        self.assertIsNone(paths.assigned)
+
+
+if __name__=='__main__':
+    unittest.main()
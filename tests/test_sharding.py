@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+'''Sharding: every phenopacket in exactly one shard wherever the root is
+mounted, and the files of the shards merged as those of a single run'''
+import json
+import os
+import tempfile
+import unittest
+
+from routines2compo.Manifest import VERSION, load_manifest
+from routines2compo.Sharding import parse_shard, shard_of, shard_path, merge_shards
+
+
+class ShardTest(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('2/4'),(2,4))
+        self.assertEqual(parse_shard('1/1'),(1,1))
+        for spec in ('0/4','5/4','1/0','a/b','1','1/2/3'):
+            with self.subTest(spec=spec):
+                with self.assertRaises(ValueError):
+                    parse_shard(spec)
+
+    def test_partition(self):
+        files=[f'd{i%7}/p{i}.json' for i in range(400)]
+        for count in (1,3,8):
+            with self.subTest(count=count):
+                shards=[shard_of('/data/Phenos/'+name,'/data/Phenos',count) for name in files]
+                self.assertTrue(all(1<=shard<=count for shard in shards))
+                #the same shard under another mount point
+                self.assertEqual(shards,[shard_of('/mnt/x/Phenos/'+name,'/mnt/x/Phenos/',count) for name in files])
+                if count>1:
+                    self.assertEqual(set(shards),set(range(1,count+1)))
+
+    def test_shard_path(self):
+        self.assertEqual(shard_path('run.log',2,4),'run.log.shard-2-of-4')
+
+
+class MergeShardsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        base=self.dir.name
+        self.paths=[os.path.join(base,name) for name in ('run.log','run.manifest','run.deadletter','run.verify.json')]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self,kind:int,index:int,count:int,content)->None:
+        with open(shard_path(self.paths[kind],index,count),'w') as f:
+            if isinstance(content,str):
+                f.write(content)
+            else:
+                json.dump(content,f)
+
+    def manifest(self,files:dict,settings:dict=None)->dict:
+        return {'version':VERSION,'settings':settings or {'output_format':'pretty'},'files':files}
+
+    def report(self,entries:list,seconds:float)->dict:
+        return {'totals':{'seconds':seconds},'files':entries}
+
+    def test_merge(self):
+        for index in (1,2,3):
+            self.write(0,index,3,f'log of {index}\n')
+            self.write(1,index,3,self.manifest({f'p{index}.json':{'inputs':{},'output':{}}}))
+            self.write(2,index,3,json.dumps({'phenopacket':f'p{index}.json','error':'bad'}))
+            self.write(3,index,3,self.report([{'phenopacket':f'p{index}.json','status':'pass' if index!=2 else 'fail'}],index))
+        self.assertEqual(merge_shards(3,*self.paths),{'log':[],'manifest':[],'dead letter':[],'verify report':[]})
+        with open(self.paths[0]) as f:
+            log=f.read()
+        self.assertEqual(log.count('=== shard '),3)
+        self.assertLess(log.index('log of 1'),log.index('log of 3'))
+        manifest=load_manifest(self.paths[1],{'output_format':'pretty'})
+        self.assertEqual(sorted(manifest['files']),['p1.json','p2.json','p3.json'])
+        with open(self.paths[2]) as f:
+            self.assertEqual([json.loads(line)['phenopacket'] for line in f],['p1.json','p2.json','p3.json'])
+        with open(self.paths[3]) as f:
+            totals=json.load(f)['totals']
+        self.assertEqual((totals['files'],totals['pass'],totals['fail'],totals['seconds']),(3,2,1,3))
+
+    def test_missing_shards(self):
+        self.write(0,2,3,'log of 2\n')
+        self.write(2,1,3,'')
+        self.assertEqual(merge_shards(3,*self.paths),{'log':[1,3],'dead letter':[2,3]})
+        self.assertFalse(os.path.exists(self.paths[1]))
+        self.assertEqual(merge_shards(3,*[path+'.none' for path in self.paths]),{})
+
+    def test_manifests_of_other_settings(self):
+        self.write(1,1,2,self.manifest({},{'output_format':'pretty'}))
+        self.write(1,2,2,self.manifest({},{'output_format':'gzip'}))
+        with self.assertRaisesRegex(ValueError,'settings'):
+            merge_shards(2,*self.paths)
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+'''the stream reader must decode the same values whatever the chunks the file
+is read in: strings, numbers and literals split across two chunks, values
+bigger than a chunk'''
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from routines2compo.StreamJson import JsonStreamReader, loads, read_object_streaming
+
+DOCUMENT={
+    'id':'cohort "1" {not an object} [not an array]',
+    'description':'é中\\ \t'+'x'*300,
+    'members':[
+        {'id':'m0','pos':123456789,'score':-1.5e-07,'ok':True,'none':None,'terms':[{'id':'HP:0001250'}]*5},
+        [],
+        {},
+        42,
+        'member, with ] and }',
+        False,
+        {'deep':[[[[{'a':[1,2,3]}]]]]},
+    ],
+    'htsFiles':[{'uri':'file://a.vcf'}],
+    'metaData':{'created':'2019-01-01T00:00:00Z','resources':[]},
+}
+CHUNKS=(1,2,3,5,7,64,1<<20)
+
+
+def _read(text:str,chunk:int)->dict:
+    '''DOCUMENT read back through the reader, the members element by element'''
+    reader=JsonStreamReader(io.StringIO(text),chunk)
+    document={}
+    for key in reader.items():
+        document[key]=list(reader.array()) if key=='members' else reader.value()
+    return document
+
+
+class JsonStreamReaderTest(unittest.TestCase):
+    def test_chunk_boundaries(self):
+        for text in (json.dumps(DOCUMENT),json.dumps(DOCUMENT,indent=4),json.dumps(DOCUMENT,separators=(',',':'))):
+            for chunk in CHUNKS:
+                with self.subTest(chunk=chunk,length=len(text)):
+                    self.assertEqual(_read(text,chunk),DOCUMENT)
+
+    def test_number_at_the_end_of_a_chunk(self):
+        #12 could be decoded from the first chunk alone
+        for chunk in CHUNKS:
+            with self.subTest(chunk=chunk):
+                reader=JsonStreamReader(io.StringIO('{"a":123456,"b":[1.25e3,-7,true]}'),chunk)
+                self.assertEqual([(key,reader.value()) for key in reader.items()],[('a',123456),('b',[1250.0,-7,True])])
+
+    def test_empty(self):
+        for text in ('{}',' {\n} ','{"members":[]}'):
+            with self.subTest(text=text):
+                self.assertEqual(_read(text,1),json.loads(text))
+
+    def test_truncated(self):
+        for text in ('{"a":[1,2','{"a":"unterminated','{"a":1','{"a" 1}','{"a":1 "b":2}',''):
+            for chunk in (1,4,64):
+                with self.subTest(text=text,chunk=chunk):
+                    with self.assertRaises(ValueError):
+                        _read(text,chunk)
+
+    def test_duplicate_keys(self):
+        #refused as json_format.Parse does, at the top level or below
+        for text in ('{"a":1,"b":2,"a":3}','{"a":{"b":1,"b":1}}','{"m":[{"id":"x"},{"id":"y","id":"z"}]}'):
+            for chunk in (1,64):
+                with self.subTest(text=text,chunk=chunk):
+                    with self.assertRaisesRegex(ValueError,'duplicated'):
+                        _read(text,chunk)
+            with self.subTest(text=text):
+                with self.assertRaisesRegex(ValueError,'duplicated'):
+                    loads(text.encode())
+        self.assertEqual(loads(b'{"a":{"b":[{"a":1}]},"b":1}'),{'a':{'b':[{'a':1}]},'b':1})
+
+
+class ReadObjectStreamingTest(unittest.TestCase):
+    def setUp(self):
+        fd,self.path=tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def write(self,document)->None:
+        with open(self.path,'w') as f:
+            json.dump(document,f,indent=2)
+
+    def test_members_handed_one_by_one(self):
+        self.write(DOCUMENT)
+        seen=[]
+        header,count=read_object_streaming(self.path,'members',lambda i,member: seen.append((i,member)))
+        self.assertEqual(count,len(DOCUMENT['members']))
+        self.assertEqual(seen,list(enumerate(DOCUMENT['members'])))
+        self.assertEqual(header,{key:value for key,value in DOCUMENT.items() if key!='members'})
+
+    def test_no_array(self):
+        for document in ({'id':'i','phenopacket':{'members':[1]}},{'members':{'not':'an array'}}):
+            with self.subTest(document=document):
+                self.write(document)
+                self.assertEqual(read_object_streaming(self.path,'members',self.fail),(document,None))
+
+    def test_element_failure_stops_the_read(self):
+        self.write(DOCUMENT)
+        def element(i,member):
+            if i==2:
+                raise KeyError(i)
+        with self.assertRaises(KeyError):
+            read_object_streaming(self.path,'members',element)
+
+
+if __name__=='__main__':
+    unittest.main()
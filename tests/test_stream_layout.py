@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+'''--stream with the mirror and hashed layouts: the composition of a cohort goes
+to a directory that does not exist yet, streamed or not the same file is written'''
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from routines2compo.OutputLayout import OutputLayout
+
+SAMPLES=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'Phenopackets')
+COHORT='PHENO_FROMcohort_report_structured_composition'
+
+try:
+    #the generated schema imports protobuf
+    importlib.import_module('phenopackets_pb2')
+    SCHEMA=True
+except ImportError:
+    SCHEMA=False
+
+
+@unittest.skipUnless(SCHEMA,'the conversion validates against the phenopackets schema (protobuf)')
+class StreamLayoutTest(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.TemporaryDirectory()
+        self.root=os.path.join(self.dir.name,'Phenopackets')
+        os.makedirs(self.root)
+        for ext in ('.json','.ctxinfo','.context'):
+            shutil.copy(os.path.join(SAMPLES,COHORT+ext),self.root)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_stream_into_new_directories(self):
+        from routines2compo.Convert2Composition import convert2composition
+        filename=os.path.join(self.root,COHORT+'.json')
+        for layout in ('mirror','hashed'):
+            written=[]
+            for stream in (True,False):
+                with self.subTest(layout=layout,stream=stream):
+                    outputdir=os.path.join(self.dir.name,f'{layout}-{stream}','new')
+                    outputfile=OutputLayout(layout,outputdir).path(filename,self.root)
+                    self.assertFalse(os.path.exists(os.path.dirname(outputfile)))
+                    convert2composition(filename,outputfile,stream,'pretty')
+                    with open(outputfile,'rb') as f:
+                        written.append(f.read())
+            self.assertEqual(written[0],written[1])
+
+
+if __name__=='__main__':
+    unittest.main()